@@ -1,9 +1,15 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import cv2
 import numpy as np
 from paddleocr import PaddleOCR
 import pandas as pd
-from PIL import Image
+import os
+import queue
+import hashlib
+import threading
+import concurrent.futures
+from contextlib import contextmanager
 
 # --- MUST BE FIRST STREAMLIT COMMAND ---
 st.set_page_config(page_title="OCR Table Extractor", layout="wide")
@@ -13,62 +19,212 @@ st.set_page_config(page_title="OCR Table Extractor", layout="wide")
 def load_ocr():
     return PaddleOCR(use_angle_cls=True, lang='en')
 
-ocr = load_ocr()
+# Images OCR'd at once in batch uploads. A PaddleOCR instance is not safe to share
+# between threads, so each worker gets its own; the first is load_ocr()'s, the rest
+# are only built once a batch needs them.
+APP_OCR_WORKERS = int(os.environ.get("APP_OCR_WORKERS", 2))
+
+class OCRPool:
+    def __init__(self, first, size):
+        self._idle = queue.LifoQueue()
+        self._idle.put(first)
+        self._spare = max(0, size - 1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def engine(self):
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                build = self._spare > 0
+                self._spare -= build
+            if not build:
+                engine = self._idle.get()
+            else:
+                try:
+                    engine = PaddleOCR(use_angle_cls=True, lang='en')
+                except Exception:
+                    with self._lock:
+                        self._spare += 1
+                    raise
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+@st.cache_resource
+def load_ocr_pool():
+    return OCRPool(load_ocr(), APP_OCR_WORKERS)
+
+ocr_pool = load_ocr_pool()
+
+# Angle classification follows the backend's OCR_ANGLE_CLS=auto policy: the widest few
+# text crops of a page go through the classifier, and every crop only does when one of
+# them reads as confidently upside down
+OCR_ORIENTATION_SAMPLE = int(os.environ.get("OCR_ORIENTATION_SAMPLE", 5))
+
+if "orientation_stats" not in st.session_state:
+    st.session_state.orientation_stats = {"skipped": 0, "classified": 0}
+
+# Perspective-crop one detected text box (same as PaddleOCR's get_rotate_crop_image)
+def crop_text_box(img, box):
+    pts = np.array(box, dtype=np.float32)
+    crop_w = int(max(np.linalg.norm(pts[0] - pts[1]), np.linalg.norm(pts[2] - pts[3])))
+    crop_h = int(max(np.linalg.norm(pts[0] - pts[3]), np.linalg.norm(pts[1] - pts[2])))
+    crop_w, crop_h = max(crop_w, 1), max(crop_h, 1)
+    dst = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]])
+    M = cv2.getPerspectiveTransform(pts, dst)
+    crop = cv2.warpPerspective(img, M, (crop_w, crop_h),
+                               borderMode=cv2.BORDER_REPLICATE,
+                               flags=cv2.INTER_CUBIC)
+    # vertical text: rotate so the recognizer sees a horizontal line
+    if crop_h / crop_w >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+# Order detected boxes top→bottom, then left→right within a line (same as PaddleOCR)
+def sort_text_boxes(boxes):
+    boxes = sorted(boxes, key=lambda b: (b[0][1], b[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+def page_needs_angle_cls(ocr, crops):
+    sample = sorted(range(len(crops)), key=lambda i: crops[i].shape[1], reverse=True)
+    sample = [crops[i] for i in sample[:max(1, OCR_ORIENTATION_SAMPLE)]]
+    _, cls_res, _ = ocr.text_classifier(sample)
+    thresh = getattr(ocr.text_classifier, "cls_thresh", 0.9)
+    return any(label == "180" and score >= thresh for label, score in cls_res)
+
+# Detect, classify when needed, recognize: the stages of ocr.ocr(), run separately so
+# the orientation decision is made once per page.
+# Returns [(box, (text, confidence))] and whether every crop was classified.
+def run_ocr(ocr, image_rgb, always_classify=False):
+    dt_boxes, _ = ocr.text_detector(image_rgb)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return [], False
+    boxes = sort_text_boxes([b.tolist() for b in dt_boxes])
+    crops = [crop_text_box(image_rgb, b) for b in boxes]
+    classified = always_classify or page_needs_angle_cls(ocr, crops)
+    if classified:
+        crops, _, _ = ocr.text_classifier(crops)
+    rec_res, _ = ocr.text_recognizer(crops)
+    results = [(box, res) for box, res in zip(boxes, rec_res) if res[1] >= ocr.drop_score]
+    return results, classified
 
 # --- OCR Processing ---
-def process_image(uploaded_image):
-    image_bytes = uploaded_image.getvalue()
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+# Cached by the upload's content hash, so reruns and re-uploads of the same image
+# don't OCR it again (the bytes themselves are left out of Streamlit's hashing).
+# The body only runs on a cache miss, so that is where `_computed` (also unhashed)
+# collects each actual run's orientation decision for the stats.
+@st.cache_data(show_spinner=False, max_entries=256)
+def ocr_cells(digest, _image_bytes, always_classify=False, _computed=None):
+    img = cv2.imdecode(np.frombuffer(_image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
     image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    
-    results = ocr.ocr(image_rgb, cls=True)
+
+    with ocr_pool.engine() as ocr:
+        results, classified = run_ocr(ocr, image_rgb, always_classify)
     cells = []
-    for box, (text, confidence) in results[0]:
+    for box, (text, confidence) in results:
         if text.strip():
             y_center = int((box[0][1] + box[2][1]) / 2)
             cells.append((y_center, text.strip(), confidence))
     cells.sort(key=lambda c: c[0])
+    if _computed is not None:
+        _computed.append(classified)
     return cells
 
-# Confidence level indicator
-def confidence_indicator(confidence):
-    if confidence >= 0.9:
-        return "🟢 High"
-    elif confidence >= 0.8:
-        return "🟠 Medium"
-    else:
-        return "🔴 Low"
+def count_orientation(computed):
+    stats = st.session_state.orientation_stats
+    for classified in computed:
+        stats["classified" if classified else "skipped"] += 1
+
+def process_image(uploaded_image, always_classify=False):
+    image_bytes = uploaded_image.getvalue()
+    computed = []
+    cells = ocr_cells(hashlib.sha256(image_bytes).hexdigest(), image_bytes, always_classify, computed)
+    count_orientation(computed)
+    return cells
+
+# OCR several uploads at once on the engine pool. Returns one entry per upload, in
+# order: its cells, or the exception it raised. Identical uploads are OCR'd once.
+def process_images(uploaded_images, always_classify=False):
+    blobs = [f.getvalue() for f in uploaded_images]
+    digests = [hashlib.sha256(b).hexdigest() for b in blobs]
+    unique = dict(zip(digests, blobs))
+    ctx = get_script_run_ctx()
+    outcomes, computed = {}, []
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(APP_OCR_WORKERS, len(unique))),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as executor:
+        futures = {executor.submit(ocr_cells, d, b, always_classify, computed): d for d, b in unique.items()}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as e:
+                outcomes[futures[future]] = e
+    count_orientation(computed)
+    return [outcomes[d] for d in digests]
+
+# Confidence level indicator, for a whole column of confidences at once
+def confidence_indicator(confidences):
+    conf = np.asarray(confidences, dtype=float)
+    return np.select([conf >= 0.9, conf >= 0.8], ["🟢 High", "🟠 Medium"], "🔴 Low")
+
+# One text and one confidence column per data column; shorter columns are padded with ""
+def build_table(column_data, data_columns):
+    parts = []
+    for name, cells in zip(data_columns, column_data):
+        col = pd.DataFrame(cells, columns=["y", "text", "confidence"])
+        parts.append(pd.DataFrame({
+            name: col["text"],
+            f"{name} Confidence": confidence_indicator(col["confidence"]),
+        }))
+    return pd.concat(parts, axis=1).fillna("")
 
 # --- Main Application ---
 st.title("OCR Table Extractor")
 mode = st.radio("Choose a mode:", ["Quick Text Copy (Paragraph)", "Column-by-Column Table Extract"])
+always_classify = st.checkbox("Always classify every text line's orientation (slower, for mixed-orientation photos)")
+stats = st.session_state.orientation_stats
+st.caption(f"Full orientation pass skipped on {stats['skipped']} of {stats['skipped'] + stats['classified']} images")
 
 if mode == "Quick Text Copy (Paragraph)":
-    st.subheader("Upload an image for Paragraph OCR")
-    
-    uploaded_file = st.file_uploader("Choose an image file", type=["jpg", "jpeg", "png"])
-    
-    if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Image", width=300)
-        
-        if st.button("Process Image"):
-            with st.spinner("Processing..."):
-                try:
-                    data = process_image(uploaded_file)
-                    df = pd.DataFrame({
-                        "Text": [text for _, text, _ in data],
-                        "Confidence": [confidence_indicator(conf) for _, _, conf in data]
-                    })
-                    
-                    st.data_editor(df, use_container_width=True, num_rows="dynamic")
-
-                    full_text = "\n".join(df["Text"])
-                    st.download_button("Download as TXT", full_text, file_name="extracted_text.txt")
-                    
-                except Exception as e:
-                    st.error(f"Error processing image: {str(e)}")
+    st.subheader("Upload images for Paragraph OCR")
+
+    uploaded_files = st.file_uploader("Choose image files (several drawings are OCR'd in parallel)",
+                                      type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+
+    if uploaded_files:
+        st.image([f.getvalue() for f in uploaded_files], caption=[f.name for f in uploaded_files], width=300)
+
+        if st.button("Process Images"):
+            with st.spinner(f"Processing {len(uploaded_files)} image(s)..."):
+                outcomes = process_images(uploaded_files, always_classify)
+            texts = []
+            for uploaded_file, data in zip(uploaded_files, outcomes):
+                if isinstance(data, Exception):
+                    st.error(f"Error processing {uploaded_file.name}: {str(data)}")
+                    continue
+                cells = pd.DataFrame(data, columns=["y", "text", "confidence"])
+                df = pd.DataFrame({
+                    "Text": cells["text"],
+                    "Confidence": confidence_indicator(cells["confidence"])
+                })
+                st.markdown(f"**{uploaded_file.name}**")
+                st.data_editor(df, use_container_width=True, num_rows="dynamic", key=f"text_{uploaded_file.file_id}")
+                texts.append("\n".join(df["Text"]))
+
+            if texts:
+                st.download_button("Download as TXT", "\n\n".join(texts), file_name="extracted_text.txt")
 
 elif mode == "Column-by-Column Table Extract":
     st.subheader("Column-by-Column Table Extract")
@@ -76,50 +232,64 @@ elif mode == "Column-by-Column Table Extract":
     
     if 'column_data' not in st.session_state:
         st.session_state.column_data = [[] for _ in data_columns]
-    
-    col_index = st.selectbox("Select column to process:", 
-                             range(len(data_columns)), 
-                             format_func=lambda x: data_columns[x])
-    
-    uploaded_file = st.file_uploader(f"Upload image for {data_columns[col_index]}", 
-                                     type=["jpg", "jpeg", "png"])
-    
-    if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption=f"Uploaded Image for {data_columns[col_index]}", width=300)
-        
-        if st.button("Process Column"):
-            with st.spinner("Processing..."):
-                try:
-                    column = process_image(uploaded_file)
+
+    batch = st.checkbox("Upload all columns at once")
+
+    if batch:
+        uploaded_files = st.file_uploader("Upload one image per column, in column order",
+                                          type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+        if uploaded_files:
+            targets = []
+            for i, uploaded_file in enumerate(uploaded_files):
+                left, right = st.columns([1, 2])
+                left.image(uploaded_file.getvalue(), width=200)
+                targets.append(right.selectbox(f"Column for {uploaded_file.name}:",
+                                               range(len(data_columns)),
+                                               index=i % len(data_columns),
+                                               format_func=lambda x: data_columns[x],
+                                               key=f"target_{uploaded_file.file_id}"))
+
+            # each column takes one image; a second one would silently replace the first
+            duplicates = sorted({data_columns[t] for t in targets if targets.count(t) > 1})
+            if duplicates:
+                st.error(f"Several images are assigned to: {', '.join(duplicates)}. "
+                         "Give each column exactly one image.")
+
+            if st.button("Process All Columns", disabled=bool(duplicates)):
+                with st.spinner(f"Processing {len(uploaded_files)} column image(s)..."):
+                    outcomes = process_images(uploaded_files, always_classify)
+                for uploaded_file, col_index, column in zip(uploaded_files, targets, outcomes):
+                    if isinstance(column, Exception):
+                        st.error(f"Error processing {uploaded_file.name}: {str(column)}")
+                        continue
                     st.session_state.column_data[col_index] = column
                     st.success(f"Column '{data_columns[col_index]}' processed successfully!")
-                except Exception as e:
-                    st.error(f"Error processing image: {str(e)}")
+    else:
+        col_index = st.selectbox("Select column to process:", 
+                                 range(len(data_columns)), 
+                                 format_func=lambda x: data_columns[x])
+
+        uploaded_file = st.file_uploader(f"Upload image for {data_columns[col_index]}", 
+                                         type=["jpg", "jpeg", "png"])
+
+        if uploaded_file is not None:
+            st.image(uploaded_file.getvalue(), caption=f"Uploaded Image for {data_columns[col_index]}", width=300)
+
+            if st.button("Process Column"):
+                with st.spinner("Processing..."):
+                    try:
+                        column = process_image(uploaded_file, always_classify)
+                        st.session_state.column_data[col_index] = column
+                        st.success(f"Column '{data_columns[col_index]}' processed successfully!")
+                    except Exception as e:
+                        st.error(f"Error processing image: {str(e)}")
 
     # Display editable spreadsheet with confidence indicators
     if any(len(col) > 0 for col in st.session_state.column_data):
         st.subheader("Extracted Table (Editable)")
 
-        max_rows = max(len(col) for col in st.session_state.column_data)
-        table_data = []
-        
-        for i in range(max_rows):
-            row = []
-            for col in st.session_state.column_data:
-                if i < len(col):
-                    text, conf = col[i][1], confidence_indicator(col[i][2])
-                else:
-                    text, conf = "", ""
-                row.extend([text, conf])
-            table_data.append(row)
-
-        # Create DataFrame with alternating columns for text and confidence
-        expanded_columns = []
-        for col in data_columns:
-            expanded_columns.extend([col, f"{col} Confidence"])
-        
-        df = pd.DataFrame(table_data, columns=expanded_columns)
+        # Alternating columns for text and confidence
+        df = build_table(st.session_state.column_data, data_columns)
 
         edited_df = st.data_editor(df, use_container_width=True, num_rows="dynamic")
 
@@ -0,0 +1,182 @@
+# Benchmark: OCR engines side by side, with an agreement check against the first one.
+#
+# Usage:
+#   python bench_engines.py path/to/images [--engines paddle,onnx] [--repeat 3]
+#   python bench_engines.py --synthetic 3 [--engines paddle,onnx]   # bench_tables images
+#   python bench_engines.py ... --min-agreement 0.98                 # exit 1 below this
+#
+# Every image goes through the simple_cells pipeline (normalize, detect, classify when
+# needed, recognize) on each engine, timing each stage. The first engine is the
+# reference: boxes are paired by IoU >= 0.5, and the paired boxes' texts are compared
+# (exact matches and character similarity). Thread and batch settings come from the
+# usual OCR_CPU_THREADS / OCR_ONNX_THREADS / OCR_REC_BATCH, or the flags below.
+import argparse
+import difflib
+import statistics
+import time
+
+import cv2
+
+import main
+from bench_normalize import load_images
+
+STAGES = ("detect", "classify", "recognize")
+
+
+def synthetic_images(samples, seed):
+    from bench_tables import SCENARIOS, generate
+    return [
+        (name, cv2.cvtColor(img, cv2.COLOR_BGR2RGB), truth)
+        for scenario in SCENARIOS
+        for name, img, truth in generate(scenario, samples, seed)
+    ]
+
+
+def run_engine(engine, rgb, cls):
+    """[(box, text)] in original-image coordinates, and seconds per stage."""
+    small, scale = main.normalize_for_ocr(rgb)
+    timings = {}
+    started = time.perf_counter()
+    boxes, crops = main.detect_boxes(engine, small)
+    timings["detect"] = time.perf_counter() - started
+    started = time.perf_counter()
+    crops = main.classify_crops(engine, crops, cls)
+    timings["classify"] = time.perf_counter() - started
+    started = time.perf_counter()
+    rec_res = main.recognize_on(engine, crops)
+    timings["recognize"] = time.perf_counter() - started
+    drop_score = getattr(engine, "drop_score", 0.5)
+    items = [
+        (main.unscale_box(box, scale), text)
+        for box, (text, conf) in zip(boxes, rec_res)
+        if conf >= drop_score
+    ]
+    return items, timings
+
+
+def bounds(box):
+    xs = [p[0] for p in box]
+    ys = [p[1] for p in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def iou(a, b):
+    ax0, ay0, ax1, ay1 = bounds(a)
+    bx0, by0, bx1, by1 = bounds(b)
+    w = max(0.0, min(ax1, bx1) - max(ax0, bx0))
+    h = max(0.0, min(ay1, by1) - max(ay0, by0))
+    inter = w * h
+    union = (ax1 - ax0) * (ay1 - ay0) + (bx1 - bx0) * (by1 - by0) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference, candidate):
+    """(paired boxes, reference boxes, candidate boxes, exact texts, summed char similarity)"""
+    unused = list(range(len(candidate)))
+    paired = exact = 0
+    chars = 0.0
+    for box, text in reference:
+        best, best_iou = None, 0.5
+        for j in unused:
+            overlap = iou(box, candidate[j][0])
+            if overlap >= best_iou:
+                best, best_iou = j, overlap
+        if best is None:
+            continue
+        unused.remove(best)
+        other = candidate[best][1]
+        paired += 1
+        exact += text == other
+        chars += difflib.SequenceMatcher(None, text, other, autojunk=False).ratio()
+    return paired, len(reference), len(candidate), exact, chars
+
+
+def run(images, engine_names, repeat, cls):
+    engines = {}
+    for name in engine_names:
+        started = time.perf_counter()
+        engines[name] = main.build_ocr_engine(name)
+        print(f"⏱️ {name}: loaded in {time.perf_counter() - started:.1f}s")
+
+    reference = {}
+    rows = []
+    for name, engine in engines.items():
+        run_engine(engine, images[0][1], cls)  # first call allocates, keep it out of the numbers
+        totals, stages = [], {stage: [] for stage in STAGES}
+        counts = [0, 0, 0, 0, 0.0]
+        for image_name, rgb, _ in images:
+            for _ in range(repeat):
+                items, timings = run_engine(engine, rgb, cls)
+                totals.append(sum(timings.values()))
+                for stage in STAGES:
+                    stages[stage].append(timings[stage])
+            if name == engine_names[0]:
+                reference[image_name] = items
+            else:
+                for k, value in enumerate(agreement(reference[image_name], items)):
+                    counts[k] += value
+        totals.sort()
+        paired, n_ref, n_cand, exact, chars = counts
+        rows.append({
+            "engine": name,
+            "p50_ms": 1000 * statistics.median(totals),
+            "p95_ms": 1000 * totals[min(len(totals) - 1, int(0.95 * len(totals)))],
+            **{f"{stage}_ms": 1000 * statistics.mean(stages[stage]) for stage in STAGES},
+            "boxes": 2 * paired / (n_ref + n_cand) if n_ref + n_cand else 1.0,
+            "exact": exact / paired if paired else (0.0 if n_ref else 1.0),
+            "chars": chars / paired if paired else (0.0 if n_ref else 1.0),
+        })
+        if name == engine_names[0]:
+            rows[-1].update(boxes=1.0, exact=1.0, chars=1.0)  # the reference agrees with itself
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR engine latency and agreement with a reference engine")
+    parser.add_argument("path", nargs="?", help="image file or directory of images")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="use N synthetic columns per bench_tables scenario instead of a path")
+    parser.add_argument("--engines", default="paddle,onnx", help="comma-separated; the first is the reference")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cls", choices=["auto", "on", "off"], default="auto", help="angle classification")
+    parser.add_argument("--paddle-threads", type=int, help="override OCR_CPU_THREADS")
+    parser.add_argument("--onnx-threads", type=int, help="override OCR_ONNX_THREADS")
+    parser.add_argument("--rec-batch", type=int, help="override OCR_REC_BATCH")
+    parser.add_argument("--min-agreement", type=float,
+                        help="exit 1 when any engine's exact-text agreement is below this")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.paddle_threads:
+        main.OCR_CPU_THREADS = args.paddle_threads
+    if args.onnx_threads:
+        main.OCR_ONNX_THREADS = args.onnx_threads
+    if args.rec_batch:
+        main.OCR_REC_BATCH = args.rec_batch
+
+    if args.synthetic:
+        images = synthetic_images(args.synthetic, args.seed)
+    elif args.path:
+        images = load_images(args.path)
+    else:
+        parser.error("give an image path or --synthetic N")
+    if not images:
+        raise SystemExit("No images found")
+
+    engine_names = [e for e in args.engines.split(",") if e]
+    cls = {"auto": None, "on": True, "off": False}[args.cls]
+    print(f"📊 {len(images)} image(s), {args.repeat} run(s) each, reference engine: {engine_names[0]}")
+    rows = run(images, engine_names, args.repeat, cls)
+    print(f"{'engine':>8} {'p50 ms':>9} {'p95 ms':>9} {'det ms':>8} {'cls ms':>8} {'rec ms':>8} "
+          f"{'boxes':>7} {'exact':>7} {'chars':>7}")
+    for row in rows:
+        print(f"{row['engine']:>8} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['detect_ms']:>8.1f} "
+              f"{row['classify_ms']:>8.1f} {row['recognize_ms']:>8.1f} {row['boxes']:>7.3f} "
+              f"{row['exact']:>7.3f} {row['chars']:>7.3f}")
+
+    if args.min_agreement is not None:
+        low = [row["engine"] for row in rows if row["exact"] < args.min_agreement]
+        if low:
+            print(f"❌ Exact-text agreement below {args.min_agreement}: {', '.join(low)}")
+            raise SystemExit(1)
+        print(f"✅ Every engine agrees with {engine_names[0]} on at least {args.min_agreement:.1%} of texts")
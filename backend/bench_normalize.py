@@ -0,0 +1,100 @@
+# Benchmark: OCR latency vs. accuracy for different text-height normalization targets.
+#
+# Usage:
+#   python bench_normalize.py path/to/images [--targets 0,16,24,32] [--repeat 3]
+#
+# Every image is OCR'd with simple_cells once per target height (0 = no resize).
+# Accuracy is the text similarity to <image>.txt next to the image when it
+# exists (one cell per line), otherwise to the full-resolution (target 0) run.
+import argparse
+import difflib
+import os
+import statistics
+import time
+
+import cv2
+
+import main
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def load_images(path):
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.lower().endswith(IMAGE_EXTS)
+        )
+    images = []
+    for f in files:
+        img = cv2.imread(f, cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"⚠️ Skipping unreadable image: {f}")
+            continue
+        truth_path = os.path.splitext(f)[0] + ".txt"
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as fh:
+                truth = [line.strip() for line in fh if line.strip()]
+        images.append((f, cv2.cvtColor(img, cv2.COLOR_BGR2RGB), truth))
+    return images
+
+
+def similarity(cells, expected):
+    return difflib.SequenceMatcher(None, "\n".join(cells), "\n".join(expected)).ratio()
+
+
+def run(images, targets, repeat):
+    main.ocr_pool.warm()
+    baseline = {}
+    rows = []
+    for target in targets:
+        main.OCR_TARGET_TEXT_HEIGHT = target
+        latencies, scores, scales = [], [], []
+        for name, rgb, truth in images:
+            _, scale = main.normalize_for_ocr(rgb)
+            scales.append(scale)
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cells = main.simple_cells(rgb)
+                latencies.append(time.perf_counter() - started)
+            texts = [c["text"] for c in cells]
+            if target == 0:
+                baseline[name] = texts
+            expected = truth if truth is not None else baseline.get(name)
+            if expected is not None:
+                scores.append(similarity(texts, expected))
+        latencies.sort()
+        rows.append({
+            "target": target,
+            "p50_ms": 1000 * statistics.median(latencies),
+            "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "mean_scale": statistics.mean(scales),
+            "accuracy": statistics.mean(scores) if scores else float("nan"),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR latency vs. accuracy per normalization target")
+    parser.add_argument("path", help="image file or directory of images")
+    parser.add_argument("--targets", default="0,16,24,32,48",
+                        help="comma-separated OCR_TARGET_TEXT_HEIGHT values; 0 = no resize")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    targets = sorted({float(t) for t in args.targets.split(",")})
+    if 0.0 not in targets:
+        targets.insert(0, 0.0)  # the full-resolution run is the accuracy reference
+
+    images = load_images(args.path)
+    if not images:
+        raise SystemExit("No images found")
+
+    print(f"📊 {len(images)} image(s), {args.repeat} run(s) each")
+    print(f"{'target':>8} {'p50 ms':>10} {'p95 ms':>10} {'scale':>8} {'accuracy':>10}")
+    for row in run(images, targets, args.repeat):
+        print(f"{row['target']:>8.0f} {row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f} "
+              f"{row['mean_scale']:>8.2f} {row['accuracy']:>10.3f}")
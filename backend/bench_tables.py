@@ -0,0 +1,262 @@
+# Benchmark: cell strategies on synthetic BOM-table columns with known ground truth.
+#
+# Usage:
+#   python bench_tables.py [--scenarios baseline,no_grid,...] [--samples 3] [--repeat 3]
+#                          [--strategies simple,advanced,rectangles,grid]
+#                          [--save-baseline bench_baseline.json] [--baseline bench_baseline.json]
+#   python bench_tables.py --dump out_dir    # write the images + <image>.txt truth and exit
+#
+# Every scenario changes one thing from "baseline" (row count, font size, grid lines,
+# skew, noise + JPEG quality, image size). Images are drawn with OpenCV's built-in fonts
+# from a fixed seed, so runs are repeatable and need no network or GPU.
+# With --baseline the run exits 1 when a p95 latency grows by more than --latency-tolerance
+# or an accuracy drops by more than --accuracy-tolerance, so it can gate changes.
+import argparse
+import difflib
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import main
+
+SCENARIOS = {
+    "baseline":   {},
+    "many_rows":  {"rows": 60},
+    "few_rows":   {"rows": 5},
+    "small_font": {"font_px": 12},
+    "large_font": {"font_px": 32},
+    "no_grid":    {"grid": False},
+    "skew":       {"skew": 1.5},
+    "noisy_jpeg": {"noise": 12.0, "jpeg_quality": 45},
+    "large":      {"size": 2.5},
+}
+DEFAULTS = {"rows": 20, "font_px": 20, "grid": True, "skew": 0.0, "noise": 0.0, "jpeg_quality": 0, "size": 1.0}
+
+# Cell strategy -> how it is called on a decoded BGR image
+STRATEGIES = {
+    "simple":     lambda bgr: main.simple_cells(main.to_rgb(bgr)),
+    "advanced":   lambda bgr: main.advanced_cells(bgr),
+    "rectangles": lambda bgr: main.advanced_cells_with_rectangles(bgr),
+    "grid":       lambda bgr: main.grid_cells(bgr),
+}
+
+PREFIXES = ["WZ", "AB", "DRG", "PL", "SH", "BR"]
+PARTS = ["HEX BOLT", "PLAIN WASHER", "SPRING WASHER", "HEX NUT", "BEARING", "SHAFT", "BUSH",
+         "COVER PLATE", "BRACKET", "GASKET", "O RING", "CIRCLIP", "KEY", "SPACER", "FLANGE"]
+MATERIALS = ["SS304", "SS316", "EN8", "EN19", "MS", "CI FG260", "AL6061", "BRASS", "NBR", "PTFE"]
+
+
+def column_texts(kind, rows, rng):
+    if kind == "part":
+        return [f"{rng.choice(PREFIXES)}-{rng.randint(100, 99999):05d}-{rng.choice('ABC')}" for _ in range(rows)]
+    if kind == "description":
+        return [f"{rng.choice(PARTS)} M{rng.choice([6, 8, 10, 12, 16])}X{rng.randint(10, 120)}" for _ in range(rows)]
+    if kind == "quantity":
+        return [str(rng.choice([1, 1, 2, 2, 4, 6, 8, 12, 24])) for _ in range(rows)]
+    return [rng.choice(MATERIALS) for _ in range(rows)]
+
+
+def render_column(texts, rows, font_px, grid, skew, noise, jpeg_quality, size, rng):
+    """Draw one BOM column (one text line per row) and return it as a BGR image."""
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    scale = font_px / 22.0  # HERSHEY_SIMPLEX glyphs are ~22 px tall at scale 1
+    thickness = max(1, int(round(font_px / 12)))
+    widths = [cv2.getTextSize(t, font, scale, thickness)[0][0] for t in texts]
+    row_h = int(font_px * 2.0)
+    pad = int(font_px * 0.8)
+    width = max(widths) + 2 * pad
+    height = rows * row_h + 2
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    for i, (text, w) in enumerate(zip(texts, widths)):
+        top = 1 + i * row_h
+        baseline = top + (row_h + font_px) // 2
+        x = pad + rng.randint(0, max(0, width - 2 * pad - w) // 4)
+        cv2.putText(img, text, (x, baseline), font, scale, (0, 0, 0), thickness, cv2.LINE_AA)
+        if grid:
+            cv2.line(img, (0, top), (width - 1, top), (0, 0, 0), 1)
+    if grid:
+        cv2.line(img, (0, height - 1), (width - 1, height - 1), (0, 0, 0), 1)
+        cv2.rectangle(img, (0, 0), (width - 1, height - 1), (0, 0, 0), 1)
+
+    if skew:
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        img = cv2.warpAffine(img, M, (width, height), borderValue=(255, 255, 255))
+    if size != 1.0:
+        img = cv2.resize(img, None, fx=size, fy=size, interpolation=cv2.INTER_CUBIC)
+    if noise:
+        np_rng = np.random.default_rng(rng.randint(0, 2 ** 31))
+        img = np.clip(img + np_rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    if jpeg_quality:
+        _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return img
+
+
+def generate(scenario, samples, seed):
+    """[(name, bgr image, truth rows)] for one scenario; the same seed gives the same images."""
+    params = {**DEFAULTS, **SCENARIOS[scenario]}
+    rng = random.Random(f"{seed}:{scenario}")
+    kinds = ["part", "description", "quantity", "material"]
+    out = []
+    for i in range(samples):
+        kind = kinds[i % len(kinds)]
+        texts = column_texts(kind, params["rows"], rng)
+        img = render_column(texts, rng=rng, **params)
+        out.append((f"{scenario}_{i:02d}_{kind}", img, texts))
+    return out
+
+
+def cell_accuracy(cells, truth):
+    """(exact cells matched in order / truth rows, character similarity of the whole column)"""
+    predicted = [" ".join(c["text"].split()).upper() for c in cells]
+    expected = [" ".join(t.split()).upper() for t in truth]
+    matcher = difflib.SequenceMatcher(None, predicted, expected, autojunk=False)
+    exact = sum(block.size for block in matcher.get_matching_blocks())
+    chars = difflib.SequenceMatcher(None, "\n".join(predicted), "\n".join(expected), autojunk=False).ratio()
+    return exact / len(expected), chars
+
+
+def peak_memory(fn, img):
+    """Peak Python/NumPy allocation (MB) during one call; native inference buffers aren't seen."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(img)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(scenarios, strategies, samples, repeat, seed):
+    main.ocr_pool.warm()
+    results = []
+    for scenario in scenarios:
+        images = generate(scenario, samples, seed)
+        for strategy in strategies:
+            fn = STRATEGIES[strategy]
+            fn(images[0][1])  # first call per strategy pays one-off setup
+            latencies, exact, chars, rows = [], [], [], 0
+            for _, img, truth in images:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cells = fn(img)
+                    latencies.append(time.perf_counter() - started)
+                e, c = cell_accuracy(cells, truth)
+                exact.append(e)
+                chars.append(c)
+                rows += len(truth) * repeat
+            latencies.sort()
+            results.append({
+                "scenario": scenario,
+                "strategy": strategy,
+                "p50_ms": 1000 * statistics.median(latencies),
+                "p95_ms": 1000 * percentile(latencies, 0.95),
+                "p99_ms": 1000 * percentile(latencies, 0.99),
+                "rows_per_s": rows / sum(latencies),
+                "peak_mb": max(peak_memory(fn, img) for _, img, _ in images),
+                "cell_accuracy": statistics.mean(exact),
+                "char_accuracy": statistics.mean(chars),
+            })
+    return results
+
+
+def compare(results, baseline, latency_tolerance, accuracy_tolerance):
+    """Lines describing every regression against `baseline` (empty when there are none)."""
+    previous = {(r["scenario"], r["strategy"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get((r["scenario"], r["strategy"]))
+        if old is None:
+            continue
+        if r["p95_ms"] > old["p95_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{r['scenario']}/{r['strategy']}: p95 {old['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        for key in ("cell_accuracy", "char_accuracy"):
+            if r[key] < old[key] - accuracy_tolerance:
+                regressions.append(f"{r['scenario']}/{r['strategy']}: {key} {old[key]:.3f} -> {r[key]:.3f}")
+    return regressions
+
+
+def dump(scenarios, samples, seed, out_dir):
+    # same layout bench_normalize.py reads: <image>.png with <image>.txt beside it
+    os.makedirs(out_dir, exist_ok=True)
+    for scenario in scenarios:
+        for name, img, truth in generate(scenario, samples, seed):
+            cv2.imwrite(os.path.join(out_dir, name + ".png"), img)
+            with open(os.path.join(out_dir, name + ".txt"), "w", encoding="utf-8") as fh:
+                fh.write("\n".join(truth) + "\n")
+    print(f"📁 Wrote {len(scenarios) * samples} image(s) to {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cell strategies on synthetic BOM-table columns")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="comma-separated strategy names")
+    parser.add_argument("--samples", type=int, default=4, help="column images per scenario")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results here as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against this baseline; exit 1 on regression")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed relative p95 growth")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01, help="allowed absolute accuracy drop")
+    parser.add_argument("--dump", metavar="DIR", help="only write the generated images and truth files")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    strategies = [s for s in args.strategies.split(",") if s]
+    unknown = [s for s in scenarios if s not in SCENARIOS] + [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        raise SystemExit(f"Unknown scenario/strategy: {', '.join(unknown)}")
+
+    if args.dump:
+        dump(scenarios, args.samples, args.seed, args.dump)
+        raise SystemExit(0)
+
+    print(f"📊 {len(scenarios)} scenario(s) x {len(strategies)} strategy(ies), "
+          f"{args.samples} image(s) each, {args.repeat} run(s) per image")
+    results = run(scenarios, strategies, args.samples, args.repeat, args.seed)
+
+    print(f"{'scenario':<12} {'strategy':<11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'rows/s':>8} {'peak MB':>8} {'cells':>7} {'chars':>7}")
+    for r in results:
+        print(f"{r['scenario']:<12} {r['strategy']:<11} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['rows_per_s']:>8.1f} {r['peak_mb']:>8.1f} "
+              f"{r['cell_accuracy']:>7.3f} {r['char_accuracy']:>7.3f}")
+    # ru_maxrss is KB on Linux: the process high-water mark, Paddle's native memory included
+    print(f"🧠 Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    record = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "samples": args.samples,
+        "model_version": main.OCR_MODEL_VERSION,
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as fh:
+            json.dump(record, fh, indent=2)
+        print(f"💾 Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.latency_tolerance, args.accuracy_tolerance)
+        if regressions:
+            print("❌ Regressions against", args.baseline)
+            for line in regressions:
+                print("  " + line)
+            raise SystemExit(1)
+        print("✅ No regressions against", args.baseline)
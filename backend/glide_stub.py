@@ -0,0 +1,88 @@
+# Local stand-in for the Glide API (queryTables / mutateTables), for load tests.
+#
+# Usage:
+#   uvicorn glide_stub:app --port 8081
+#   GLIDE_API_BASE=http://127.0.0.1:8081 OCR_ENGINE=stub uvicorn main:app --port 8000
+#
+# The drawings table holds GLIDE_STUB_ROWS deterministic rows, served GLIDE_STUB_PAGE_SIZE
+# at a time with a "next" cursor like the real API. Every call waits GLIDE_STUB_LATENCY_MS
+# (plus up to GLIDE_STUB_JITTER_MS), and GLIDE_STUB_429_RATE / GLIDE_STUB_503_RATE of calls
+# fail with that status so retry and backoff paths get exercised.
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+GLIDE_STUB_ROWS = int(os.environ.get("GLIDE_STUB_ROWS", 5000))
+GLIDE_STUB_PAGE_SIZE = int(os.environ.get("GLIDE_STUB_PAGE_SIZE", 1000))
+GLIDE_STUB_LATENCY_MS = float(os.environ.get("GLIDE_STUB_LATENCY_MS", 80))
+GLIDE_STUB_JITTER_MS = float(os.environ.get("GLIDE_STUB_JITTER_MS", 40))
+GLIDE_STUB_429_RATE = float(os.environ.get("GLIDE_STUB_429_RATE", 0))
+GLIDE_STUB_503_RATE = float(os.environ.get("GLIDE_STUB_503_RATE", 0))
+
+# Projects P0..P9, parts PART-000..PART-049; the load generator asks for these
+PROJECTS = [f"P{i}" for i in range(10)]
+PARTS = [f"PART-{i:03d}" for i in range(50)]
+
+app = FastAPI()
+stats = {"queries": 0, "mutations": 0, "rows_added": 0, "rate_limited": 0, "unavailable": 0}
+
+
+def drawing_row(i):
+    return {
+        "$rowID": f"row-{i}",
+        "VQlMl": PROJECTS[i % len(PROJECTS)],
+        "nlHAO": PARTS[(i // len(PROJECTS)) % len(PARTS)],
+        "Name": f"Part {i}",
+        "9iB5E": f"https://files.example.com/drawings/WZ-{i:05d}-A.pdf",
+    }
+
+
+async def simulate():
+    """Wait like the network would; returns an error response when this call should fail."""
+    await asyncio.sleep((GLIDE_STUB_LATENCY_MS + random.uniform(0, GLIDE_STUB_JITTER_MS)) / 1000)
+    roll = random.random()
+    if roll < GLIDE_STUB_429_RATE:
+        stats["rate_limited"] += 1
+        return JSONResponse(status_code=429, content={"message": "Too many requests"}, headers={"Retry-After": "1"})
+    if roll < GLIDE_STUB_429_RATE + GLIDE_STUB_503_RATE:
+        stats["unavailable"] += 1
+        return JSONResponse(status_code=503, content={"message": "Service unavailable"})
+    return None
+
+
+@app.post("/queryTables")
+async def query_tables(request: Request):
+    body = await request.json()
+    error = await simulate()
+    if error is not None:
+        return error
+    stats["queries"] += 1
+    results = []
+    for query in body.get("queries", []):
+        start = int(query.get("startAt") or 0)
+        end = min(start + GLIDE_STUB_PAGE_SIZE, GLIDE_STUB_ROWS)
+        page = {"rows": [drawing_row(i) for i in range(start, end)]}
+        if end < GLIDE_STUB_ROWS:
+            page["next"] = str(end)
+        results.append(page)
+    return results
+
+
+@app.post("/mutateTables")
+async def mutate_tables(request: Request):
+    body = await request.json()
+    error = await simulate()
+    if error is not None:
+        return error
+    mutations = body.get("mutations", [])
+    stats["mutations"] += 1
+    stats["rows_added"] += sum(1 for m in mutations if m.get("kind") == "add-row-to-table")
+    return [{"rowID": f"new-{random.getrandbits(32):08x}"} for _ in mutations]
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,269 @@
+# Load test: drive the API at several concurrency levels and report throughput,
+# tail latency, and error / 429 rates.
+#
+# Usage:
+#   python load_test.py --spawn [--scenario mixed] [--concurrency 1,4,16] [--duration 20]
+#   python load_test.py --url http://127.0.0.1:8000 --scenario ocr --image path/to/column.png
+#   python load_test.py --spawn --check-disconnect   # exit 1 if abandoned OCR keeps its slot
+#
+# --spawn starts the service with the stub OCR engine (OCR_ENGINE=stub) plus the Glide
+# stand-in (glide_stub.py), so only this process's environment is needed: no models, no
+# network. Extra settings go to the spawned service through the environment as usual,
+# e.g. OCR_STUB_DET_MS=300 OCR_WORKERS=4 python load_test.py --spawn.
+#
+# Scenarios:
+#   ocr     POST / (table mode) with a synthetic column image; every request gets a
+#           slightly different image so the result cache doesn't answer it
+#   fetch   POST /fetch-drawings for the stand-in's projects/parts
+#   submit  POST /add-child-parts and /add-bo-parts with 20 rows each
+#   mixed   10 ocr : 8 fetch : 2 submit
+#
+# --check-disconnect fills every OCR worker plus one queue slot with requests whose client
+# gives up after a second, then checks that /health counts each of them as cancelled and
+# that the queued one never ran. The service needs slow detection for that (--spawn sets
+# OCR_STUB_DET_MS=3000 unless it is already set).
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import cv2
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIX = {"mixed": [("ocr", 10), ("fetch", 8), ("submit", 2)]}
+
+
+def column_images(path, variants):
+    """PNG-encoded variants of one column image, each differing in a corner pixel."""
+    if path:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise SystemExit(f"Could not read {path}")
+    else:
+        from bench_tables import generate
+        from main import StubOCREngine
+        _, img, truth = generate("baseline", 1, 1)[0]
+        # the stub must see one text line per ruled row, or every OCR request simulates
+        # the wrong number of recognition crops
+        boxes, _ = StubOCREngine(det_ms=0).text_detector(img)
+        if len(boxes) != len(truth):
+            raise SystemExit(f"Stub detector found {len(boxes)} line(s) in a {len(truth)}-row ruled column")
+    out = []
+    for i in range(variants):
+        variant = img.copy()
+        variant[0, 0] = (i & 0xFF, (i >> 8) & 0xFF, 0)
+        out.append(cv2.imencode(".png", variant)[1].tobytes())
+    return out
+
+
+def submit_payload(rng, bo):
+    rows = [
+        {
+            "itemNumber": n + 1,
+            "quantity": str(rng.randint(1, 12)),
+            "description": f"HEX BOLT M{rng.choice([8, 10, 12])}X{rng.randint(10, 80)}",
+            "material": rng.choice(["SS304", "EN8", "MS"]),
+            ("boughtoutPartNumber" if bo else "drawingNumber"): f"WZ-{rng.randint(0, 99999):05d}-A",
+            "ocrWarning": "",
+        }
+        for n in range(20)
+    ]
+    return {
+        "rows": rows,
+        "project": f"P{rng.randint(0, 9)}",
+        "parentDrawingNumber": "WZ-00001-A",
+        "partNumber": f"PART-{rng.randint(0, 49):03d}",
+        "rowID": f"row-{rng.randint(0, 999)}",
+        "maxItemNumber": 20,
+    }
+
+
+async def one_request(client, kind, images, rng):
+    if kind == "ocr":
+        files = {"image": ("column.png", rng.choice(images), "image/png")}
+        return await client.post("/", files=files, data={"mode": "table"})
+    if kind == "fetch":
+        body = {"project": f"P{rng.randint(0, 9)}", "part": f"PART-{rng.randint(0, 49):03d}"}
+        return await client.post("/fetch-drawings", json=body)
+    bo = rng.random() < 0.5
+    return await client.post("/add-bo-parts" if bo else "/add-child-parts", json=submit_payload(rng, bo))
+
+
+async def run_level(url, scenario, concurrency, duration, images, seed):
+    kinds = [(k, w) for k, w in MIX.get(scenario, [(scenario, 1)])]
+    samples = []  # (kind, seconds, status or None for a transport error)
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        async def worker(n):
+            rng = random.Random(f"{seed}:{concurrency}:{n}")
+            while time.perf_counter() < deadline:
+                kind = rng.choices([k for k, _ in kinds], weights=[w for _, w in kinds])[0]
+                started = time.perf_counter()
+                try:
+                    status = (await one_request(client, kind, images, rng)).status_code
+                except httpx.HTTPError:
+                    status = None
+                samples.append((kind, time.perf_counter() - started, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s for _, s, _ in samples)
+    n = len(samples)
+
+    def pct(q):
+        return 1000 * latencies[min(n - 1, int(q * n))] if n else float("nan")
+
+    errors = sum(1 for _, _, status in samples if status is None or (status >= 400 and status != 429))
+    limited = sum(1 for _, _, status in samples if status == 429)
+    return {
+        "requests": n,
+        "rps": n / elapsed if elapsed else 0.0,
+        "p50_ms": 1000 * statistics.median(latencies) if n else float("nan"),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "error_rate": errors / n if n else 0.0,
+        "rate_429": limited / n if n else 0.0,
+    }
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def spawn(port, glide_port, **extra_env):
+    """Start the Glide stand-in and the service (stub engine); returns both processes."""
+    glide = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "glide_stub:app", "--port", str(glide_port), "--log-level", "warning"],
+        cwd=HERE,
+    )
+    env = {
+        **os.environ,
+        "OCR_ENGINE": os.environ.get("OCR_ENGINE", "stub"),
+        "GLIDE_API_BASE": f"http://127.0.0.1:{glide_port}",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        **{k: os.environ.get(k, v) for k, v in extra_env.items()},
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL,
+    )
+    wait_until_up(f"http://127.0.0.1:{glide_port}/stats")
+    wait_until_up(f"http://127.0.0.1:{port}/ready")
+    return glide, server
+
+
+def queue_stats(url):
+    return httpx.get(f"{url}/health", timeout=10).json()["ocr_queue"]
+
+
+async def abandon_requests(url, count, images):
+    async with httpx.AsyncClient(base_url=url, timeout=1) as client:
+        async def one(i):
+            files = {"image": ("column.png", images[i], "image/png")}
+            try:
+                await client.post("/", files=files, data={"mode": "table"})
+            except httpx.TimeoutException:
+                return
+            raise SystemExit("❌ An OCR request finished within the 1s client timeout; slow the engine down")
+        await asyncio.gather(*(one(i) for i in range(count)))
+
+
+def check_disconnect(url, images, timeout=30):
+    """True when abandoned OCR requests are cancelled and free their worker slots."""
+    before = queue_stats(url)
+    if not before["cancel_on_disconnect"]:
+        print("❌ The service reports cancel_on_disconnect off (see its startup warning)")
+        return False
+    count = before["workers"] + 1
+    asyncio.run(abandon_requests(url, count, images))
+    deadline = time.time() + timeout
+    after = queue_stats(url)
+    while (after["running"] or after["waiting"]) and time.time() < deadline:
+        time.sleep(0.5)
+        after = queue_stats(url)
+    cancelled = after["cancelled"] - before["cancelled"]
+    completed = after["completed"] - before["completed"]
+    print(f"📊 {count} abandoned request(s): cancelled={cancelled} completed={completed} "
+          f"running={after['running']} waiting={after['waiting']}")
+    if after["running"] or after["waiting"]:
+        print(f"❌ Worker slots still busy {timeout}s after the clients left")
+        return False
+    if cancelled != count:
+        print(f"❌ Expected {count} cancellation(s), got {cancelled}")
+        return False
+    if completed > before["workers"]:
+        print("❌ The queued request ran after its client had gone")
+        return False
+    print("✅ Abandoned requests are cancelled, and queued ones never reach a worker")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and tail latency at several concurrency levels")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", default="mixed", choices=["ocr", "fetch", "submit", "mixed"])
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--image", help="column image for the ocr scenario (default: a synthetic one)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--spawn", action="store_true", help="start the service (stub engine) and Glide stand-in")
+    parser.add_argument("--port", type=int, default=8765, help="service port with --spawn")
+    parser.add_argument("--glide-port", type=int, default=8766, help="Glide stand-in port with --spawn")
+    parser.add_argument("--check-disconnect", action="store_true",
+                        help="check that abandoned OCR requests are cancelled instead of load testing")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+    images = column_images(args.image, 256)
+    url = args.url
+    processes = []
+    if args.spawn:
+        extra_env = {"OCR_STUB_DET_MS": "3000"} if args.check_disconnect else {}
+        processes = spawn(args.port, args.glide_port, **extra_env)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        if args.check_disconnect:
+            if not check_disconnect(url, images):
+                raise SystemExit(1)
+            raise SystemExit(0)
+        print(f"📊 {args.scenario} against {url}, {args.duration:g}s per level")
+        print(f"{'conc':>5} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'errors':>7} {'429s':>7}")
+        for level in levels:
+            samples, elapsed = asyncio.run(run_level(url, args.scenario, level, args.duration, images, args.seed))
+            r = summarize(samples, elapsed)
+            print(f"{level:>5} {r['requests']:>9} {r['rps']:>8.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+                  f"{r['p99_ms']:>9.1f} {r['error_rate']:>7.1%} {r['rate_429']:>7.1%}")
+            if args.scenario == "mixed":
+                for kind, _ in MIX["mixed"]:
+                    part = [s for s in samples if s[0] == kind]
+                    if part:
+                        k = summarize(part, elapsed)
+                        print(f"{'':>5} {kind:>9} {k['rps']:>8.1f} {k['p50_ms']:>9.1f} {k['p95_ms']:>9.1f} "
+                              f"{k['p99_ms']:>9.1f} {k['error_rate']:>7.1%} {k['rate_429']:>7.1%}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
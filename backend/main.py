@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import UploadFile, MutableHeaders
 import cv2
 import numpy as np
 import os
@@ -9,15 +10,97 @@ import logging
 import re
 import httpx  # used to fecth drawing numbers (File name)
 import uuid
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import io
+import threading
+import time
+import queue
+import hashlib
+import json
+import sqlite3
+import copy
+import math
+import random
+import contextvars
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import OrderedDict, Counter
+from urllib.parse import unquote
+from contextlib import contextmanager
+
+# Configure logging (LOG_LEVEL=DEBUG shows per-item OCR output)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+# Fraction of OCR calls whose individual items are logged at DEBUG, and how many items each
+OCR_ITEM_LOG_SAMPLE_RATE = float(os.environ.get("OCR_ITEM_LOG_SAMPLE_RATE", 0.1))
+OCR_ITEM_LOG_MAX = int(os.environ.get("OCR_ITEM_LOG_MAX", 20))
+
 app = FastAPI()
 
 print("🚀 Server has started and main.py is loaded")
 
+# Prometheus-style latency histogram with a single label (e.g. the pipeline stage)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.setdefault(label_value, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def drain(self):
+        # Hand over everything observed so far and start again (OCR worker processes send
+        # their stage timings back to the parent with each result)
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        with self._lock:
+            for label_value, counts in series.items():
+                mine = self._series.setdefault(label_value, [0] * len(self.buckets) + [0, 0.0])
+                for i, n in enumerate(counts):
+                    mine[i] += n
+
+    @contextmanager
+    def time(self, label_value):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - started)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                label = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-2]}')
+                lines.append(f"{self.name}_count{{{label}}} {series[-2]}")
+                lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+        return "\n".join(lines)
+
+# Stages: upload_read, decode, pdf_render, color_convert, normalize, detection, classification,
+# recognition, layout (ruling/cell analysis), postprocess
+ocr_stage_seconds = Histogram("ocr_stage_seconds", "Time spent in each OCR pipeline stage", "stage")
+glide_request_seconds = Histogram("glide_request_seconds", "Latency of Glide API calls", "call")
+http_request_seconds = Histogram("http_request_seconds", "End-to-end request latency per route", "route")
+
 # Configure CORS - explicitly allow your GitHub Pages d
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +108,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "HEAD", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
 # Paths to pre-downloaded model files
@@ -33,6 +117,98 @@ DET_MODEL_DIR = os.path.join(PADDLE_HOME, "whl/det/en/en_PP-OCRv3_det_infer")
 REC_MODEL_DIR = os.path.join(PADDLE_HOME, "whl/rec/en/en_PP-OCRv3_rec_infer")
 CLS_MODEL_DIR = os.path.join(PADDLE_HOME, "whl/cls/ch_ppocr_mobile_v2.0_cls_infer")
 
+# Which OCR engine get_ocr_model builds: "paddle" (PaddleOCR on paddlepaddle), "onnx" (the
+# same PP-OCRv3 models converted for ONNX Runtime, see onnx_engine.py), or "stub"
+# (StubOCREngine, no models needed)
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "paddle")
+# ONNX engine: directory holding det.onnx, rec.onnx, cls.onnx (optional) and en_dict.txt
+OCR_ONNX_DIR = os.environ.get("OCR_ONNX_DIR", os.path.join(PADDLE_HOME, "onnx"))
+
+# Identifies the models behind a cached OCR result; bump OCR_PIPELINE_VERSION
+# whenever post-processing changes so stale cache entries stop matching
+OCR_PIPELINE_VERSION = "4"
+OCR_MODEL_VERSION = "+".join(
+    [os.path.basename(d) for d in (DET_MODEL_DIR, REC_MODEL_DIR, CLS_MODEL_DIR)] + [OCR_PIPELINE_VERSION]
+)
+if OCR_ENGINE == "onnx":
+    OCR_MODEL_VERSION = f"onnx-{os.path.basename(os.path.normpath(OCR_ONNX_DIR))}+{OCR_PIPELINE_VERSION}"
+elif OCR_ENGINE != "paddle":
+    OCR_MODEL_VERSION = f"{OCR_ENGINE}+{OCR_PIPELINE_VERSION}"
+
+# Number of PaddleOCR instances kept loaded in this process
+OCR_POOL_SIZE = int(os.environ.get("OCR_POOL_SIZE", 2))
+
+# Images are rescaled so their typical glyph is about this many pixels tall before OCR
+# (0 disables). Only ever shrinks, and never below OCR_MIN_SCALE of the upload.
+OCR_TARGET_TEXT_HEIGHT = float(os.environ.get("OCR_TARGET_TEXT_HEIGHT", 24))
+OCR_MIN_SCALE = float(os.environ.get("OCR_MIN_SCALE", 0.25))
+
+# Upload limits: bytes per image, and how many column images /table accepts
+OCR_MAX_UPLOAD_MB = float(os.environ.get("OCR_MAX_UPLOAD_MB", 20))
+OCR_MAX_TABLE_COLUMNS = int(os.environ.get("OCR_MAX_TABLE_COLUMNS", 8))
+# Images whose longer side is at least twice this are decoded at 1/2, 1/4 or 1/8 resolution
+OCR_MAX_DECODE_SIDE = int(os.environ.get("OCR_MAX_DECODE_SIDE", 2400))
+
+# Angle classification: "auto" samples a few text crops per image and only runs the
+# classifier on every box when one of them looks upside down; "on"/"off" force it
+OCR_ANGLE_CLS = os.environ.get("OCR_ANGLE_CLS", "auto")
+OCR_ORIENTATION_SAMPLE = int(os.environ.get("OCR_ORIENTATION_SAMPLE", 5))
+
+# Grid mode: a cell counts as blank when less than this fraction of its inside is ink
+OCR_MIN_INK_DENSITY = float(os.environ.get("OCR_MIN_INK_DENSITY", 0.005))
+# Grid mode: shortest run (px) that can count as a ruling line, and smallest cell side (px)
+GRID_MIN_LINE = int(os.environ.get("GRID_MIN_LINE", 40))
+GRID_MIN_CELL = int(os.environ.get("GRID_MIN_CELL", 10))
+
+# Debug artifacts (cell maps etc.): off unless OCR_DEBUG_ARTIFACTS=1. Then a request is
+# captured when it sends "X-Debug-Artifacts: 1" or falls within OCR_DEBUG_SAMPLE_RATE.
+# The newest OCR_DEBUG_MAX_ITEMS / OCR_DEBUG_MAX_MB worth of images are kept in memory.
+OCR_DEBUG_ARTIFACTS = os.environ.get("OCR_DEBUG_ARTIFACTS", "0") == "1"
+OCR_DEBUG_SAMPLE_RATE = float(os.environ.get("OCR_DEBUG_SAMPLE_RATE", 0))
+OCR_DEBUG_MAX_ITEMS = int(os.environ.get("OCR_DEBUG_MAX_ITEMS", 50))
+OCR_DEBUG_MAX_MB = float(os.environ.get("OCR_DEBUG_MAX_MB", 50))
+
+# OCR result cache: in-memory entries, plus an optional on-disk tier (off when OCR_CACHE_DIR is empty)
+OCR_CACHE_MAX_ITEMS = int(os.environ.get("OCR_CACHE_MAX_ITEMS", 256))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "")
+OCR_CACHE_DISK_MAX_MB = float(os.environ.get("OCR_CACHE_DISK_MAX_MB", 200))
+
+# Where OCR runs: "thread" (engine pool in this process) or "process" (one engine per worker
+# process; decoded images are handed over through /dev/shm, so give containers enough --shm-size)
+OCR_EXECUTION = os.environ.get("OCR_EXECUTION", "thread")
+OCR_PROCESS_WORKERS = int(os.environ.get("OCR_PROCESS_WORKERS", os.cpu_count() or 1))
+# Inference threads per engine: Paddle's (its own default is 10) and ONNX Runtime's intra-op threads
+OCR_CPU_THREADS = int(os.environ.get("OCR_CPU_THREADS", 10))
+OCR_ONNX_THREADS = int(os.environ.get("OCR_ONNX_THREADS", 4))
+# Text crops per recognizer batch, for either engine (Paddle's default is 6)
+OCR_REC_BATCH = int(os.environ.get("OCR_REC_BATCH", 6))
+
+# Async OCR jobs (/jobs): how many may be unfinished at once, how long each may take
+# (waiting for queue room included), and how long finished jobs are kept for polling
+OCR_JOB_MAX_ACTIVE = int(os.environ.get("OCR_JOB_MAX_ACTIVE", 16))
+OCR_JOB_DEADLINE_SECONDS = float(os.environ.get("OCR_JOB_DEADLINE_SECONDS", 300))
+OCR_JOB_TTL_SECONDS = float(os.environ.get("OCR_JOB_TTL_SECONDS", 900))
+OCR_JOB_MAX_ITEMS = int(os.environ.get("OCR_JOB_MAX_ITEMS", 200))
+
+# PDF input (/pdf, needs PyMuPDF): render resolution, pages rendered at once, page limit,
+# and how much embedded text makes a page use its text layer instead of OCR
+OCR_PDF_DPI = float(os.environ.get("OCR_PDF_DPI", 200))
+OCR_PDF_MAX_DPI = float(os.environ.get("OCR_PDF_MAX_DPI", 400))
+OCR_PDF_RENDER_WORKERS = int(os.environ.get("OCR_PDF_RENDER_WORKERS", 2))
+OCR_PDF_MAX_PAGES = int(os.environ.get("OCR_PDF_MAX_PAGES", 50))
+OCR_PDF_MIN_TEXT_CHARS = int(os.environ.get("OCR_PDF_MIN_TEXT_CHARS", 20))
+
+# OCR admission control: jobs running at once, jobs allowed to wait, and the per-request deadline
+OCR_WORKERS = int(os.environ.get(
+    "OCR_WORKERS",
+    OCR_PROCESS_WORKERS if OCR_EXECUTION == "process" else OCR_POOL_SIZE
+))
+OCR_QUEUE_LIMIT = int(os.environ.get("OCR_QUEUE_LIMIT", 8))
+OCR_DEADLINE_SECONDS = float(os.environ.get("OCR_DEADLINE_SECONDS", 60))
+
+# Startup warm-up: after loading, run each engine once on a built-in image (0 only loads them)
+OCR_WARMUP_INFERENCE = os.environ.get("OCR_WARMUP_INFERENCE", "1") == "1"
+
 # Check and log model paths on startup
 @app.on_event("startup")
 async def startup_event():
@@ -40,6 +216,26 @@ async def startup_event():
     logger.info(f"Detection model: {DET_MODEL_DIR} (exists: {os.path.exists(DET_MODEL_DIR)})")
     logger.info(f"Recognition model: {REC_MODEL_DIR} (exists: {os.path.exists(REC_MODEL_DIR)})")
     logger.info(f"Classification model: {CLS_MODEL_DIR} (exists: {os.path.exists(CLS_MODEL_DIR)})")
+    # Load and warm the engines in the background so the port opens straight away;
+    # early requests simply wait until an engine is ready, and /ready says when that is
+    asyncio.create_task(asyncio.to_thread(ocr_warmup.run))
+    if not disconnects_visible():
+        ocr_queue.cancel_on_disconnect = False
+        logger.warning("⚠️ A BaseHTTPMiddleware (@app.middleware) is installed: endpoints can't see client "
+                       "disconnects, so abandoned OCR requests run to completion (only the deadline applies)")
+    drawings_mirror.start()
+    # With write-behind on this also drains anything a previous run left in the queue; with
+    # it off the flusher only starts once a request asks for "writeBehind" (see wake())
+    if GLIDE_WRITE_BEHIND:
+        glide_write_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _ocr_process_pool is not None:
+        _ocr_process_pool.shutdown(wait=False, cancel_futures=True)
+    await drawings_mirror.stop()
+    await glide_write_queue.stop()
+    await glide.aclose()
 
 # Code look for an “O” preceded by whitespace and followed by a digit and replaces it with “Ø”
 def fix_diameter(text: str) -> str:
@@ -47,8 +243,79 @@ def fix_diameter(text: str) -> str:
     # and replace it with “Ø”
     return re.sub(r'(?<=\s)O(?=\d)', 'Ø', text)
 
-# Initialize OCR model
-def get_ocr_model():
+# Deterministic stand-in for PaddleOCR, for load tests and scheduler work without models.
+# It has the same detector / classifier / recognizer entry points the pipeline calls:
+# text lines are found from the horizontal ink profile, and each crop "reads" as a code
+# derived from its pixels. Each stage sleeps for a configurable time to stand in for
+# inference. Like Paddle's native code, the sleep doesn't hold the GIL.
+class StubOCREngine:
+    use_angle_cls = True
+    drop_score = 0.5
+    cls_thresh = 0.9
+
+    def __init__(self, det_ms=None, rec_ms=None, cls_ms=None):
+        self.det_ms = float(os.environ.get("OCR_STUB_DET_MS", 150)) if det_ms is None else det_ms
+        self.rec_ms = float(os.environ.get("OCR_STUB_REC_MS", 8)) if rec_ms is None else rec_ms
+        self.cls_ms = float(os.environ.get("OCR_STUB_CLS_MS", 2)) if cls_ms is None else cls_ms
+
+    def text_detector(self, img):
+        started = time.perf_counter()
+        gray = img.min(axis=2) if img.ndim == 3 else img
+        ink = (gray < 128).astype(np.uint8)
+        # drop table ruling first: a border or vertical rule is ink in every row and
+        # would merge all rows into one box. Ruling is any stroke spanning most of the
+        # image that is either a thin line or a sparse frame/grid (skewed ones included)
+        h, w = ink.shape
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        sx, sy, sw, sh, area = (stats[:, i] for i in range(5))
+        long_ = (sw >= 0.75 * w) | (sh >= 0.75 * h)
+        rules = long_ & ((np.minimum(sw, sh) <= 3) | (area < 0.2 * sw * sh))
+        rules[0] = False  # background
+        ink = (ink > 0) & ~rules[labels]
+        boxes = []
+        for y0, y1 in split_text_lines(ink):
+            if y1 - y0 < 4:
+                continue  # ruling lines and specks
+            cols = np.flatnonzero(ink[y0:y1].any(axis=0))
+            x0, x1 = int(cols[0]), int(cols[-1]) + 1
+            boxes.append(np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float32))
+        time.sleep(self.det_ms / 1000)
+        return boxes, time.perf_counter() - started
+
+    def text_classifier(self, crops):
+        time.sleep(self.cls_ms * len(crops) / 1000)
+        return crops, [("0", 0.99)] * len(crops), 0.0
+
+    def text_recognizer(self, crops):
+        time.sleep(self.rec_ms * len(crops) / 1000)
+        rec_res = [
+            (f"STUB-{int(hashlib.md5(np.ascontiguousarray(crop).tobytes()).hexdigest()[:8], 16) % 100000:05d}", 0.95)
+            for crop in crops
+        ]
+        return rec_res, 0.0
+
+# OCR engines. The pipeline only needs PaddleOCR's stage entry points, so any object with
+#   text_detector(img) -> (boxes, seconds)
+#   text_classifier(crops) -> (crops, [(label, score)], seconds)
+#   text_recognizer(crops) -> ([(text, score)], seconds)
+# and use_angle_cls / drop_score / cls_thresh attributes can back it.
+def import_onnx_engine():
+    try:
+        import onnx_engine
+    except ImportError:
+        raise RuntimeError("OCR_ENGINE=onnx needs onnx_engine.py next to main.py; "
+                           "the Docker image leaves it out (ONNX is local-only)") from None
+    return onnx_engine
+
+def build_ocr_engine(name):
+    if name == "stub":
+        logger.info("Initializing stub OCR engine (OCR_ENGINE=stub)")
+        return StubOCREngine()
+    if name == "onnx":
+        logger.info(f"Initializing ONNX Runtime OCR engine from {OCR_ONNX_DIR} ({OCR_ONNX_THREADS} thread(s))")
+        return import_onnx_engine().ONNXOCREngine(OCR_ONNX_DIR, threads=OCR_ONNX_THREADS, rec_batch=OCR_REC_BATCH)
+    if name != "paddle":
+        raise ValueError(f"Unknown OCR engine: {name!r} (expected paddle, onnx or stub)")
     from paddleocr import PaddleOCR
     logger.info("Initializing PaddleOCR model with pre-downloaded model files")
     return PaddleOCR(
@@ -57,30 +324,1004 @@ def get_ocr_model():
         det_model_dir=DET_MODEL_DIR,
         rec_model_dir=REC_MODEL_DIR,
         cls_model_dir=CLS_MODEL_DIR,
-        use_gpu=False
+        use_gpu=False,
+        cpu_threads=OCR_CPU_THREADS,
+        rec_batch_num=OCR_REC_BATCH
+    )
+
+# Initialize OCR model
+def get_ocr_model():
+    return build_ocr_engine(OCR_ENGINE)
+
+# Process-wide pool of pre-loaded OCR engines.
+# A PaddleOCR instance is not safe to share between threads, so each call
+# checks one out, uses it exclusively and hands it back. The pool never holds
+# more than `size` models, which also caps memory when many uploads arrive at once.
+class OCREnginePool:
+    def __init__(self, size, factory):
+        self.size = max(1, size)
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waited = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _reserve_slot(self):
+        # claim the right to build a new engine, without holding the lock while loading
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def _build(self):
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm(self):
+        """Load engines until the pool is full."""
+        started = time.perf_counter()
+        while self._reserve_slot():
+            self._idle.put(self._build())
+        logger.info(f"OCR engine pool ready: {self._created} engine(s) in {time.perf_counter() - started:.1f}s")
+
+    def checkout(self, timeout=None):
+        """Take an engine out of the pool, building one lazily if the pool is not full yet."""
+        started = time.perf_counter()
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                engine = self._build()
+            else:
+                engine = self._idle.get(timeout=timeout)
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            if waited > 0.001:
+                self._waited += 1
+        return engine
+
+    def checkin(self, engine):
+        """Return an engine obtained from checkout()."""
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(engine)
+
+    @contextmanager
+    def engine(self, timeout=None):
+        engine = self.checkout(timeout)
+        try:
+            yield engine
+        finally:
+            self.checkin(engine)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "loaded": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "checkouts_waited": self._waited,
+                "avg_wait_ms": round(1000 * self._total_wait / self._checkouts, 2) if self._checkouts else 0.0,
+                "max_wait_ms": round(1000 * self._max_wait, 2),
+            }
+
+ocr_pool = OCREnginePool(OCR_POOL_SIZE, get_ocr_model)
+
+# Process-pool execution (OCR_EXECUTION=process).
+# Each worker process loads its own engine once in _init_ocr_process and keeps it
+# for its lifetime. Images are copied into a shared-memory block and the worker
+# maps it as a NumPy array, so only the block name and shape get pickled.
+# Metrics and debug artifacts recorded in a worker would stay there, so each call
+# sends its stage timings, orientation decisions and captured images back with the
+# result, and the parent adds them to its own.
+_ocr_process_pool = None
+_ocr_process_lock = threading.Lock()
+
+def _init_ocr_process(cpu_threads):
+    global ocr_pool, OCR_CPU_THREADS, OCR_ONNX_THREADS
+    OCR_CPU_THREADS = OCR_ONNX_THREADS = cpu_threads
+    ocr_pool = OCREnginePool(1, get_ocr_model)
+    ocr_pool.warm()
+
+def _ocr_process_ready():
+    return os.getpid()
+
+def _ocr_process_call(routine, shm_name, shape, dtype, args, capture_id):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        with debug_sink.forwarding(capture_id) as artifacts:
+            img = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            result = routine(img, *args)
+            img = None  # drop the view before closing the block
+        return result, ocr_stage_seconds.drain(), drain_orientation_stats(), artifacts
+    finally:
+        shm.close()
+
+def ocr_process_pool():
+    global _ocr_process_pool
+    with _ocr_process_lock:
+        if _ocr_process_pool is None:
+            workers = max(1, OCR_PROCESS_WORKERS)
+            # split the machine's cores between workers instead of oversubscribing
+            engine_threads = OCR_ONNX_THREADS if OCR_ENGINE == "onnx" else OCR_CPU_THREADS
+            cpu_threads = max(1, min(engine_threads, (os.cpu_count() or 1) // workers))
+            _ocr_process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_ocr_process,
+                initargs=(cpu_threads,),
+            )
+        return _ocr_process_pool
+
+def warm_ocr_processes():
+    """Start every worker process so each one loads its models before traffic arrives."""
+    started = time.perf_counter()
+    pool = ocr_process_pool()
+    pids = {f.result() for f in [pool.submit(_ocr_process_ready) for _ in range(max(1, OCR_PROCESS_WORKERS))]}
+    logger.info(f"OCR worker processes ready: {len(pids)} process(es) in {time.perf_counter() - started:.1f}s")
+
+def run_in_ocr_process(routine, img, *args):
+    """Run routine(img, *args) in a worker process, passing `img` through shared memory."""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+    try:
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+        capture_id = debug_capture_request.get()
+        future = ocr_process_pool().submit(
+            _ocr_process_call, routine, shm.name, img.shape, img.dtype.str, args, capture_id
+        )
+        result, stages, orientation, artifacts = future.result()
+        ocr_stage_seconds.merge(stages)
+        merge_orientation_stats(orientation)
+        debug_sink.store_all(capture_id, artifacts)
+        return result
+    finally:
+        shm.close()
+        shm.unlink()
+
+# Run one of the cell routines (simple_cells, advanced_cells, ...) where OCR_EXECUTION says
+def run_cells(routine, img, *args):
+    if OCR_EXECUTION == "process":
+        return run_in_ocr_process(routine, img, *args)
+    return routine(img, *args)
+
+# Startup warm-up. Loading engines is only part of a cold start: the first inference
+# on each engine also builds its graph and memory pools, so every engine runs the
+# pipeline once on a small built-in image before /ready reports ready.
+def warmup_image():
+    """A few BOM-like rows of printed text between ruling lines (RGB)."""
+    rows = ["ITEM  PART NO.", "1  WZ-10234-A", "2  HEX BOLT M10X40", "3  SS304  QTY 12"]
+    img = np.full((40 * len(rows) + 10, 420, 3), 255, dtype=np.uint8)
+    for i, text in enumerate(rows):
+        y = 10 + 40 * i
+        cv2.line(img, (0, y), (419, y), (0, 0, 0), 1)
+        cv2.putText(img, text, (8, y + 28), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
+    return img
+
+def warm_up_engines(img_rgb):
+    """Run detect → classify → recognize once on every engine of this process's pool."""
+    engines = [ocr_pool.checkout() for _ in range(ocr_pool.size)]
+    try:
+        texts = []
+        for engine in engines:
+            boxes, crops = detect_boxes(engine, img_rgb)
+            texts = [text for text, _ in recognize_on(engine, classify_crops(engine, crops, True))]
+        return texts
+    finally:
+        for engine in engines:
+            ocr_pool.checkin(engine)
+
+def import_ocr_engine():
+    if OCR_ENGINE == "paddle":
+        import paddleocr  # noqa: F401
+    elif OCR_ENGINE == "onnx":
+        import_onnx_engine().import_onnxruntime()
+
+# Runs once in the background at startup and records how long each step took
+class OCRWarmup:
+    def __init__(self):
+        self.state = "pending"
+        self.error = None
+        self.steps = OrderedDict()
+        self.total_seconds = None
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        yield
+        self.steps[name] = round(time.perf_counter() - started, 3)
+        logger.info(f"⏱️ Warm-up step {name}: {self.steps[name]:.2f}s")
+
+    def run(self):
+        self.state = "running"
+        started = time.perf_counter()
+        try:
+            if OCR_EXECUTION == "process":
+                with self.step("load_engines"):
+                    warm_ocr_processes()
+            else:
+                with self.step("import"):
+                    import_ocr_engine()
+                with self.step("load_engines"):
+                    ocr_pool.warm()
+            if OCR_WARMUP_INFERENCE:
+                img = warmup_image()
+                with self.step("inference"):
+                    if OCR_EXECUTION == "process":
+                        # one job per worker; each holds its worker while it runs, so they spread out
+                        workers = max(1, OCR_PROCESS_WORKERS)
+                        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                            list(executor.map(lambda _: run_in_ocr_process(warm_up_engines, img), range(workers)))
+                    else:
+                        texts = warm_up_engines(img)
+                        logger.info(f"Warm-up image read as: {texts}")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.exception("❌ OCR warm-up failed; engines will load on first use")
+            return
+        self.total_seconds = round(time.perf_counter() - started, 3)
+        self.state = "ready"
+        logger.info(f"✅ OCR warm-up finished in {self.total_seconds:.1f}s")
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "total_seconds": self.total_seconds,
+            **{f"{name}_seconds": seconds for name, seconds in self.steps.items()},
+            **({"error": self.error} if self.error else {}),
+        }
+
+ocr_warmup = OCRWarmup()
+
+# Cache key: hash of the uploaded bytes plus everything that changes the result
+def ocr_cache_key(image_bytes, mode, column=None, cls=None):
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}|{mode}|{column or ''}|{cls}|{OCR_MODEL_VERSION}".encode()).hexdigest()
+
+# Content-addressed cache of OCR results.
+# Memory tier is an LRU of the most recent results; the optional disk tier keeps
+# one JSON file per key and evicts the oldest files once it grows past max_disk_bytes.
+# Identical requests that arrive while the first one is still running share its result.
+class OCRResultCache:
+    def __init__(self, max_items, disk_dir="", max_disk_bytes=0):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._hits = {"memory": 0, "disk": 0, "inflight": 0}
+        self._misses = 0
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(
+                os.path.getsize(os.path.join(self.disk_dir, f))
+                for f in os.listdir(self.disk_dir) if f.endswith(".json")
+            )
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Look a key up in memory, then on disk. Returns None on a miss."""
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self._misses += 1
+        return value
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._hits["memory"] += 1
+                return copy.deepcopy(self._memory[key])
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+                os.utime(path)  # keep recently used files away from eviction
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self._hits["disk"] += 1
+                return copy.deepcopy(value)
+        return None
+
+    def put(self, key, value):
+        self._remember(key, copy.deepcopy(value))
+        if not self.disk_dir:
+            return
+        try:
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            tmp_path = f"{self._disk_path(key)}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+            with self._lock:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Could not write OCR cache entry to disk: {e}")
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # trim to 90% so we don't rescan the directory on every write
+        target = self.max_disk_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return the cached value for `key`, or await `compute()` once and cache it.
+        Concurrent callers with the same key wait on the same computation.
+        """
+        value = await asyncio.to_thread(self._lookup, key)
+        if value is not None:
+            return value
+
+        while key in self._inflight:
+            pending = self._inflight[key]
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if pending.cancelled():
+                    continue  # the first caller gave up; compute it ourselves
+                raise
+            with self._lock:
+                self._hits["inflight"] += 1
+            return copy.deepcopy(value)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        with self._lock:
+            self._misses += 1
+        try:
+            value = await compute()
+        except (asyncio.CancelledError, OCRJobCancelled):
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        pending.set_result(value)
+        await asyncio.to_thread(self.put, key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self._hits.values())
+            lookups = hits + self._misses
+            return {
+                "memory_items": len(self._memory),
+                "max_items": self.max_items,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_bytes": self._disk_bytes,
+                "hits": dict(self._hits),
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "inflight": len(self._inflight),
+            }
+
+ocr_cache = OCRResultCache(
+    OCR_CACHE_MAX_ITEMS,
+    OCR_CACHE_DIR,
+    int(OCR_CACHE_DISK_MAX_MB * 1024 * 1024),
+)
+
+class OCRQueueFull(Exception):
+    """Raised when the OCR queue has no room; carries a Retry-After hint in seconds."""
+    def __init__(self, retry_after):
+        super().__init__("OCR queue is full")
+        self.retry_after = retry_after
+
+
+class OCRJobCancelled(Exception):
+    """Raised when the client went away before its OCR job finished."""
+
+
+# Bounded OCR work queue.
+# At most `workers` jobs run at once on a dedicated thread pool and at most
+# `queue_limit` more may wait; anything beyond that is rejected straight away.
+# A job that hits its deadline or whose client disconnects is dropped if it has
+# not started yet. A job that is already running can't be interrupted inside
+# Paddle, so its result is abandoned, but it keeps its worker slot until it ends.
+class OCRWorkQueue:
+    def __init__(self, workers, queue_limit):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._avg_seconds = 5.0  # running average job time, seeds the Retry-After estimate
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._cancelled = 0
+        # turned off at startup when the middleware stack can't report client disconnects
+        self.cancel_on_disconnect = True
+
+    def retry_after(self):
+        with self._lock:
+            waiting = max(0, self._pending - self.workers)
+            return max(1, math.ceil(self._avg_seconds * (waiting + 1) / self.workers))
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the OCR workers; raises OCRQueueFull when there is no room."""
+        with self._lock:
+            full = self._pending >= self.workers + self.queue_limit
+            if not full:
+                self._pending += 1
+            else:
+                self._rejected += 1
+        if full:
+            raise OCRQueueFull(self.retry_after())
+
+        abandoned = threading.Event()
+
+        def job():
+            if abandoned.is_set():
+                return None
+            with self._lock:
+                self._running += 1
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+        def release(_):
+            with self._lock:
+                self._pending -= 1
+
+        # carry the caller's context (e.g. debug capture) into the worker thread
+        future = self._executor.submit(contextvars.copy_context().run, job)
+        future.add_done_callback(release)
+        return future, abandoned
+
+    async def run(self, fn, *args, request=None, timeout=None):
+        """
+        Run fn(*args) on the OCR workers and wait for it.
+        Raises OCRQueueFull, asyncio.TimeoutError past `timeout` seconds, or
+        OCRJobCancelled when `request`'s client disconnects first. A queued job that is
+        cancelled never runs; a running one finishes in the background, as engine calls
+        can't be interrupted, but its result is dropped.
+        Disconnects are only watched when `request` is given and cancel_on_disconnect is
+        on; otherwise (background jobs, or a middleware stack that hides disconnects, which
+        startup logs as a warning) only `timeout` bounds the wait.
+        """
+        future, abandoned = self.submit(fn, *args)
+        waiter = asyncio.wrap_future(future)
+        watch = request is not None and self.cancel_on_disconnect
+        watcher = asyncio.create_task(wait_for_disconnect(request)) if watch else None
+        try:
+            done, _ = await asyncio.wait(
+                [t for t in (waiter, watcher) if t is not None],
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except asyncio.CancelledError:
+            abandoned.set()
+            future.cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        if waiter in done:
+            return waiter.result()
+
+        abandoned.set()
+        future.cancel()
+        with self._lock:
+            if watcher is not None and watcher in done:
+                self._cancelled += 1
+            else:
+                self._timed_out += 1
+        if watcher is not None and watcher in done:
+            raise OCRJobCancelled()
+        raise asyncio.TimeoutError()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "running": self._running,
+                "waiting": max(0, self._pending - self._running),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "cancelled": self._cancelled,
+                "cancel_on_disconnect": self.cancel_on_disconnect,
+                "avg_job_seconds": round(self._avg_seconds, 3),
+            }
+
+ocr_queue = OCRWorkQueue(OCR_WORKERS, OCR_QUEUE_LIMIT)
+
+# Request id of the request being served, when it was picked for debug capture
+debug_capture_request = contextvars.ContextVar("debug_capture_request", default=None)
+
+# Bounded, opt-in store of debug images.
+# capture() only queues a reference to the image; a background thread does the
+# drawing and PNG encoding, so the OCR path never waits on it. The store is a
+# ring buffer: oldest artifacts go first once max_items or max_bytes is exceeded.
+class DebugArtifactSink:
+    def __init__(self, enabled, sample_rate, max_items, max_bytes):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._artifacts = OrderedDict()  # id -> metadata + png bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=16)
+        self._worker = None
+        self._forward = None  # set in an OCR worker process: artifacts go back to the parent
+        self.dropped = 0
+
+    def should_capture(self, request):
+        if not self.enabled:
+            return False
+        if request.headers.get("x-debug-artifacts", "").lower() in ("1", "true", "yes"):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def capture(self, name, img, rects=()):
+        """Queue `img` (BGR) with `rects` outlined, if the current request is being captured."""
+        request_id = debug_capture_request.get()
+        if request_id is None:
+            return
+        if self._forward is not None:
+            png = self._render(name, img, rects)
+            if png is not None:
+                self._forward.append((name, png))
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((request_id, name, img, list(rects)))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+                self._worker.start()
+
+    def _render(self, name, img, rects):
+        try:
+            canvas = img.copy()
+            for (x, y, rw, rh) in rects:
+                cv2.rectangle(canvas, (x, y), (x+rw, y+rh), (0,255,0), 2)
+            ok, png = cv2.imencode(".png", canvas)
+            return png.tobytes() if ok else None
+        except Exception as e:
+            logger.warning(f"Could not encode debug artifact {name}: {e}")
+            return None
+
+    def _run(self):
+        while True:
+            request_id, name, img, rects = self._queue.get()
+            png = self._render(name, img, rects)
+            if png is not None:
+                self._store(request_id, name, png)
+
+    @contextmanager
+    def forwarding(self, request_id):
+        """In an OCR worker process: capture for `request_id` into a list of (name, png)
+        that goes back to the parent, instead of into this process's store."""
+        token = debug_capture_request.set(request_id)
+        self._forward = []
+        try:
+            yield self._forward
+        finally:
+            self._forward = None
+            debug_capture_request.reset(token)
+
+    def store_all(self, request_id, artifacts):
+        for name, data in artifacts:
+            self._store(request_id, name, data)
+
+    def _store(self, request_id, name, data):
+        artifact_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._artifacts[artifact_id] = {
+                "id": artifact_id,
+                "request_id": request_id,
+                "name": name,
+                "bytes": len(data),
+                "created": time.time(),
+                "data": data,
+            }
+            self._bytes += len(data)
+            while self._artifacts and (len(self._artifacts) > self.max_items or self._bytes > self.max_bytes):
+                _, old = self._artifacts.popitem(last=False)
+                self._bytes -= old["bytes"]
+
+    def list(self, request_id=None):
+        with self._lock:
+            return [
+                {k: v for k, v in a.items() if k != "data"}
+                for a in self._artifacts.values()
+                if request_id is None or a["request_id"] == request_id
+            ]
+
+    def get(self, artifact_id):
+        with self._lock:
+            return self._artifacts.get(artifact_id)
+
+debug_sink = DebugArtifactSink(
+    OCR_DEBUG_ARTIFACTS,
+    OCR_DEBUG_SAMPLE_RATE,
+    OCR_DEBUG_MAX_ITEMS,
+    int(OCR_DEBUG_MAX_MB * 1024 * 1024),
+)
+
+# Tag every request with an id (echoed as X-Request-ID) and mark the ones picked for debug capture.
+# A plain ASGI middleware on purpose: @app.middleware("http") (BaseHTTPMiddleware) hands the
+# endpoint a proxied receive channel on which request.is_disconnected() never turns True,
+# which would silently disable the OCR queue's disconnect cancellation.
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+        scope.setdefault("state", {})["request_id"] = request_id
+        debug_capture_request.set(request_id if debug_sink.should_capture(request) else None)
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                # label by route template so ids in paths don't explode the series
+                route = scope.get("route")
+                http_request_seconds.observe(
+                    f"{scope['method']} {route.path if route else 'unmatched'}",
+                    time.perf_counter() - started
+                )
+                MutableHeaders(scope=message).append("X-Request-ID", request_id)
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
+
+app.add_middleware(RequestIdMiddleware)
+
+# BaseHTTPMiddleware proxies the receive channel, and behind it request.is_disconnected()
+# never turns True; every middleware on the app has to be plain ASGI for cancellation to work
+def disconnects_visible():
+    from starlette.middleware.base import BaseHTTPMiddleware
+    return not any(
+        isinstance(m.cls, type) and issubclass(m.cls, BaseHTTPMiddleware) for m in app.user_middleware
+    )
+
+# Resolves once the HTTP client behind `request` has gone away
+async def wait_for_disconnect(request, interval=0.5):
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+# Response for a request turned away by the OCR queue
+def queue_full_response(e):
+    logger.warning(f"OCR queue full, rejecting request (retry after {e.retry_after}s)")
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+        content={"error": "Server is busy, please retry shortly."}
     )
 
+# Cheap glyph-height estimate: median-ish height of character-sized ink blobs.
+# Runs on a reduced copy of big images and reports the height in original pixels.
+def estimate_text_height(img):
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    h, w = gray.shape[:2]
+    probe = min(1.0, 1600 / max(h, w))
+    if probe < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * probe)), max(1, int(h * probe))), interpolation=cv2.INTER_AREA)
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # character-like blobs only: not specks, not grid lines, not big graphics
+    keep = (heights >= 4) & (heights <= gray.shape[0] // 4) & (widths <= heights * 3) & (areas >= 8)
+    if keep.sum() < 5:
+        return None
+    # lower quartile so small text in a mixed-size table isn't shrunk away
+    return float(np.percentile(heights[keep], 25)) / probe
+
+
+# Downscale an image so its text lands near OCR_TARGET_TEXT_HEIGHT.
+# Returns (image, scale); scale is 1.0 when the image is used as-is.
+def normalize_for_ocr(img):
+    if OCR_TARGET_TEXT_HEIGHT <= 0:
+        return img, 1.0
+    with ocr_stage_seconds.time("normalize"):
+        return _normalize_for_ocr(img)
+
+def _normalize_for_ocr(img):
+    text_h = estimate_text_height(img)
+    if not text_h:
+        return img, 1.0
+    scale = max(OCR_MIN_SCALE, min(1.0, OCR_TARGET_TEXT_HEIGHT / text_h))
+    if scale > 0.95:
+        return img, 1.0
+    h, w = img.shape[:2]
+    small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+# Map a box found on a normalized image back to original-image coordinates
+def unscale_box(box, scale):
+    if scale == 1.0:
+        return box
+    return [[x / scale, y / scale] for x, y in box]
+
+
+# Turn a per-request "cls" value into True (always), False (never) or None (auto)
+def parse_cls_option(value):
+    value = str(value or OCR_ANGLE_CLS).strip().lower()
+    if value in ("on", "true", "1", "yes"):
+        return True
+    if value in ("off", "false", "0", "no"):
+        return False
+    return None
+
+
+# How often the per-box angle classifier actually ran
+orientation_stats = {"checked": 0, "skipped": 0, "classified": 0, "forced_on": 0, "forced_off": 0}
+_orientation_lock = threading.Lock()
+
+def _count_orientation(key):
+    with _orientation_lock:
+        orientation_stats[key] += 1
+
+def drain_orientation_stats():
+    with _orientation_lock:
+        counts = dict(orientation_stats)
+        for key in orientation_stats:
+            orientation_stats[key] = 0
+    return counts
+
+def merge_orientation_stats(counts):
+    with _orientation_lock:
+        for key, n in counts.items():
+            orientation_stats[key] += n
+
+
+# Page-level orientation check: classify a handful of the widest crops (they
+# carry the most signal) and report whether any is confidently upside down
+def page_needs_angle_cls(ocr_model, crops):
+    sample = sorted(range(len(crops)), key=lambda i: crops[i].shape[1], reverse=True)
+    sample = [crops[i] for i in sample[:max(1, OCR_ORIENTATION_SAMPLE)]]
+    _, cls_res, _ = ocr_model.text_classifier(sample)
+    thresh = getattr(ocr_model, "cls_thresh", 0.9)
+    return any(label == "180" and score >= thresh for label, score in cls_res)
+
+
+def classify_crops(ocr_model, crops, cls=None):
+    """
+    Run the angle classifier over one image's crops when needed.
+    cls=True/False forces it on/off; None decides once for the whole image.
+    Returns the crops, rotated where the classifier says so.
+    """
+    if not crops or not getattr(ocr_model, "use_angle_cls", False):
+        return crops
+    with ocr_stage_seconds.time("classification"):
+        return _classify_crops(ocr_model, crops, cls)
+
+def _classify_crops(ocr_model, crops, cls):
+    if cls is None:
+        _count_orientation("checked")
+        cls = page_needs_angle_cls(ocr_model, crops)
+        _count_orientation("classified" if cls else "skipped")
+    else:
+        _count_orientation("forced_on" if cls else "forced_off")
+    if not cls:
+        return crops
+    crops, _, _ = ocr_model.text_classifier(crops)
+    return crops
+
+
+# Recognition only, on an engine that is already checked out
+def recognize_on(ocr_model, crops):
+    if not crops:
+        return []
+    with ocr_stage_seconds.time("recognition"):
+        rec_res, _ = ocr_model.text_recognizer(crops)
+    return rec_res
+
+
+# Detection only, on an engine that is already checked out: sorted boxes + their crops
+def detect_boxes(ocr_model, img_rgb):
+    with ocr_stage_seconds.time("detection"):
+        dt_boxes, _ = ocr_model.text_detector(img_rgb)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return [], []
+    boxes = sort_text_boxes([b.tolist() for b in dt_boxes])
+    return boxes, [crop_text_box(img_rgb, b) for b in boxes]
+
+
+# BGR → RGB for PaddleOCR
+def to_rgb(img):
+    with ocr_stage_seconds.time("color_convert"):
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+# Normalize, then detect → (classify) → recognize on a pooled engine, and return
+# raw PaddleOCR-style [box, (text, confidence)] items in original-image coordinates
+def ocr_image(img_rgb, cls=None):
+    small, scale = normalize_for_ocr(img_rgb)
+    with ocr_pool.engine() as ocr_model:
+        boxes, crops = detect_boxes(ocr_model, small)
+        crops = classify_crops(ocr_model, crops, cls)
+        rec_res = recognize_on(ocr_model, crops)
+        drop_score = getattr(ocr_model, "drop_score", 0.5)
+    return [
+        [unscale_box(box, scale), (text, conf)]
+        for box, (text, conf) in zip(boxes, rec_res)
+        if conf >= drop_score
+    ]
+
+
 # Process image with OCR
-def simple_cells(img_rgb):
+def simple_cells(img_rgb, cls=None):
     """
     Run PaddleOCR on an RGB image and return one cell per detected box,
     sorted by its vertical (y) center.
     """
-    ocr_model = get_ocr_model()
-    raw = ocr_model.ocr(img_rgb, cls=True)[0]
+    raw = ocr_image(img_rgb, cls)
+    return simple_cells_from_raw(raw)
+
+
+# Named regions of interest: {"PartNumber": [x, y, w, h], ...} in pixels of the uploaded
+# image, or fractions of its width/height when every value is at most 1. Coordinates are
+# in the image as displayed, i.e. after its EXIF orientation is applied (the way browsers
+# show phone photos); a region reaching past that frame is rejected rather than clipped.
+# Returns {name: (x0, y0, x1, y1)} in uploaded-image pixels.
+def parse_rois(spec, image_size):
+    rois = json.loads(spec) if isinstance(spec, str) else spec
+    if not isinstance(rois, dict) or not rois:
+        raise ValueError("rois must be a JSON object of name: [x, y, w, h]")
+    if len(rois) > OCR_MAX_TABLE_COLUMNS:
+        raise ValueError(f"At most {OCR_MAX_TABLE_COLUMNS} regions per request")
+    values = [v for rect in rois.values() for v in (rect if isinstance(rect, list) else [])]
+    fractional = all(0 <= float(v) <= 1 for v in values)
+    width, height = image_size
+    rects = {}
+    for name, rect in rois.items():
+        if not isinstance(rect, list) or len(rect) != 4:
+            raise ValueError(f"Region {name} must be [x, y, w, h]")
+        x, y, w, h = (float(v) for v in rect)
+        if fractional:
+            x, w = x * width, w * width
+            y, h = y * height, h * height
+        x0, y0 = int(x), int(y)
+        x1, y1 = int(math.ceil(x + w)), int(math.ceil(y + h))
+        # allow a pixel of rounding slack, nothing more
+        if x0 < 0 or y0 < 0 or x1 > width + 1 or y1 > height + 1 or x1 <= x0 or y1 <= y0:
+            raise ValueError(
+                f"Region {name} does not fit the {width}x{height} image (EXIF orientation applied)"
+            )
+        x1, y1 = min(width, x1), min(height, y1)
+        rects[name] = (x0, y0, x1, y1)
+    return rects
 
-    print(f"🔍 simple_cells: OCR detected {len(raw) if raw else 0} items")
-    
+
+def roi_cells(img_rgb, rects, cls=None):
+    """
+    OCR several named regions of one image with a single detection and recognition
+    pass: everything outside the regions is blanked, the union's bounding box is OCR'd
+    once, and each box goes to the region holding its centre.
+    Returns {name: cells} with cells shaped like simple_cells.
+    """
+    x0 = min(r[0] for r in rects.values())
+    y0 = min(r[1] for r in rects.values())
+    x1 = max(r[2] for r in rects.values())
+    y1 = max(r[3] for r in rects.values())
+    canvas = np.full((y1 - y0, x1 - x0, 3), 255, dtype=np.uint8)
+    for rx0, ry0, rx1, ry1 in rects.values():
+        canvas[ry0 - y0:ry1 - y0, rx0 - x0:rx1 - x0] = img_rgb[ry0:ry1, rx0:rx1]
+
+    raw = ocr_image(canvas, cls)
+    per_region = {name: [] for name in rects}
+    for box, result in raw:
+        box = [[px + x0, py + y0] for px, py in box]
+        cx = sum(px for px, _ in box) / 4
+        cy = sum(py for _, py in box) / 4
+        for name, (rx0, ry0, rx1, ry1) in rects.items():
+            if rx0 <= cx < rx1 and ry0 <= cy < ry1:
+                per_region[name].append([box, result])
+                break
+    return {name: simple_cells_from_raw(region_raw) for name, region_raw in per_region.items()}
+
+
+def simple_cells_from_raw(raw):
+    """
+    Turn raw PaddleOCR output ([box, (text, confidence)] per item) into
+    simple_cells' {text, confidence} list, sorted top→bottom.
+    """
     if not raw:
-        print("❌ OCR returned no results at all")
+        logger.info("❌ simple_cells: OCR returned no results at all")
         return []
 
+    with ocr_stage_seconds.time("postprocess"):
+        return _simple_cells_from_raw(raw)
+
+def _simple_cells_from_raw(raw):
+    # per-item lines only at DEBUG, for a sample of calls, and capped
+    log_items = logger.isEnabledFor(logging.DEBUG) and random.random() < OCR_ITEM_LOG_SAMPLE_RATE
     cells = []
     for i, (box, (text, confidence)) in enumerate(raw):
-        print(f"  Item {i}: '{text}' (conf: {confidence:.2f})")
+        if log_items and i < OCR_ITEM_LOG_MAX:
+            logger.debug(f"  Item {i}: '{text}' (conf: {confidence:.2f})")
         raw_text = text.strip()  #new line added
         if not raw_text:  #new line added
-            print(f"    ⚠️ Skipped: empty text")
             continue      #new line added
         cleaned = fix_diameter(raw_text)   #new line added       
         # if not text.strip():
@@ -93,16 +1334,176 @@ def simple_cells(img_rgb):
             "confidence": confidence
         })
 
-    print(f"📊 simple_cells: Returning {len(cells)} valid cells")
+    logger.info(f"📊 simple_cells: {len(raw)} items detected, returning {len(cells)} valid cells")
     # stable sort top→bottom
     cells.sort(key=lambda c: c["y_center"])
     # drop the y_center before returning
     return [{"text": c["text"], "confidence": c["confidence"]} for c in cells]
 
 
-def advanced_cells_with_rectangles(img):
+# Crop a (possibly rotated) text box out of the image, the way PaddleOCR does before recognition
+def crop_text_box(img, box):
+    pts = np.array(box, dtype=np.float32)
+    crop_w = int(max(np.linalg.norm(pts[0] - pts[1]), np.linalg.norm(pts[2] - pts[3])))
+    crop_h = int(max(np.linalg.norm(pts[0] - pts[3]), np.linalg.norm(pts[1] - pts[2])))
+    crop_w, crop_h = max(crop_w, 1), max(crop_h, 1)
+    dst = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]])
+    M = cv2.getPerspectiveTransform(pts, dst)
+    crop = cv2.warpPerspective(img, M, (crop_w, crop_h),
+                               borderMode=cv2.BORDER_REPLICATE,
+                               flags=cv2.INTER_CUBIC)
+    # vertical text: rotate so the recognizer sees a horizontal line
+    if crop_h / crop_w >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+# Order detected boxes top→bottom, then left→right within a line (same as PaddleOCR)
+def sort_text_boxes(boxes):
+    boxes = sorted(boxes, key=lambda b: (b[0][1], b[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+
+def detect_and_crop(img_rgb):
+    """
+    Run only the detection stage on one image.
+    Returns (boxes, crops) so recognition can be batched with other images.
+    """
+    small, scale = normalize_for_ocr(img_rgb)
+    with ocr_pool.engine() as ocr_model:
+        boxes, crops = detect_boxes(ocr_model, small)
+    return [unscale_box(b, scale) for b in boxes], crops
+
+
+def recognize_crops(crops, cls=None):
+    """
+    Classify + recognize single-line text crops from one image as one batch,
+    skipping detection. Returns ([(text, confidence), ...], drop_score).
+    """
+    if not crops:
+        return [], 0.5
+    with ocr_pool.engine() as ocr_model:
+        crops = classify_crops(ocr_model, crops, cls)
+        rec_res = recognize_on(ocr_model, crops)
+        drop_score = getattr(ocr_model, "drop_score", 0.5)
+    return rec_res, drop_score
+
+
+def recognize_batch(boxes_per_image, crops_per_image, cls=None):
+    """
+    Classify + recognize the crops of several images in a single batch and
+    split the results back into raw PaddleOCR output, one list per image.
+    The orientation decision is still made per image.
+    """
+    if not any(crops_per_image):
+        return [[] for _ in crops_per_image]
+    with ocr_pool.engine() as ocr_model:
+        crops_per_image = [classify_crops(ocr_model, crops, cls) for crops in crops_per_image]
+        flat = [crop for crops in crops_per_image for crop in crops]
+        rec_res = recognize_on(ocr_model, flat)
+        drop_score = getattr(ocr_model, "drop_score", 0.5)
+
+    raws, pos = [], 0
+    for boxes in boxes_per_image:
+        raw = []
+        for box, (text, conf) in zip(boxes, rec_res[pos:pos + len(boxes)]):
+            if conf >= drop_score:
+                raw.append([box, (text, conf)])
+        pos += len(boxes)
+        raws.append(raw)
+    return raws
+
+
+# Raw PaddleOCR output as one structured array, one row per non-empty box.
+# `text_idx` points into the parallel list of stripped texts.
+DETECTION_DTYPE = np.dtype([
+    ("corners", np.float64, (4, 2)),
+    ("cx", np.float64),
+    ("cy", np.float64),
+    ("height", np.float64),
+    ("conf", np.float64),
+    ("text_idx", np.int64),
+])
+
+def detections_from_raw(raw):
+    """Convert [box, (text, confidence)] items into (detections array, texts)."""
+    items = [(box, text.strip(), conf) for box, (text, conf) in raw if text.strip()]
+    dets = np.zeros(len(items), dtype=DETECTION_DTYPE)
+    if not items:
+        return dets, []
+    dets["corners"] = np.array([box for box, _, _ in items], dtype=np.float64).reshape(-1, 4, 2)
+    dets["conf"] = [conf for _, _, conf in items]
+    dets["text_idx"] = np.arange(len(items))
+    corners = dets["corners"]
+    # integer midpoints of the top-left/bottom-right diagonal, as the cell routines always used
+    dets["cx"] = np.floor((corners[:, 0, 0] + corners[:, 2, 0]) / 2)
+    dets["cy"] = np.floor((corners[:, 0, 1] + corners[:, 2, 1]) / 2)
+    dets["height"] = np.abs(corners[:, 2, 1] - corners[:, 0, 1])
+    return dets, [text for _, text, _ in items]
+
+
+# Uniform-grid spatial index over axis-aligned (x, y, w, h) rectangles.
+# Each rectangle is registered in every grid bucket it overlaps, so a point
+# only has to be tested against the few rectangles sharing its bucket.
+class RectIndex:
+    def __init__(self, rects):
+        r = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        self.x0, self.y0 = r[:, 0], r[:, 1]
+        self.x1, self.y1 = r[:, 0] + r[:, 2], r[:, 1] + r[:, 3]
+        # bucket size ~ a typical cell, so most buckets hold one or two rects
+        self.bucket = max(8, int(np.median(np.minimum(r[:, 2], r[:, 3])))) if len(r) else 8
+        self.buckets = {}
+        for i in range(len(r)):
+            for bx in range(self.x0[i] // self.bucket, (self.x1[i] - 1) // self.bucket + 1):
+                for by in range(self.y0[i] // self.bucket, (self.y1[i] - 1) // self.bucket + 1):
+                    self.buckets.setdefault((bx, by), []).append(i)
+
+    def lookup(self, xs, ys):
+        """For each point, the lowest index of a rectangle containing it, or -1."""
+        out = np.full(len(xs), -1, dtype=np.int64)
+        for n, (x, y) in enumerate(zip(xs, ys)):
+            candidates = self.buckets.get((int(x) // self.bucket, int(y) // self.bucket))
+            if not candidates:
+                continue
+            c = np.asarray(candidates)
+            hit = c[(self.x0[c] <= x) & (x < self.x1[c]) & (self.y0[c] <= y) & (y < self.y1[c])]
+            if len(hit):
+                out[n] = hit.min()
+        return out
+
+
+def join_groups(group_ids, dets, texts, clean=lambda t: t):
+    """
+    Merge detections sharing a group id into one {text, confidence} each.
+    Members are read top→bottom, then left→right; yields (group_id, cell)
+    in ascending group order, skipping negative ids.
+    """
+    keep = group_ids >= 0
+    group_ids, dets = group_ids[keep], dets[keep]
+    if not len(dets):
+        return
+    order = np.lexsort((dets["cx"], dets["cy"], group_ids))
+    group_ids, dets = group_ids[order], dets[order]
+    starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+    ends = np.r_[starts[1:], len(group_ids)]
+    for start, end in zip(starts, ends):
+        members = dets[start:end]
+        yield int(group_ids[start]), {
+            "text": " ".join(clean(texts[i]) for i in members["text_idx"]),
+            "confidence": float(members["conf"].min())
+        }
+
+
+def advanced_cells_with_rectangles(img, cls=None):
     # 1) resize+decode as before...
     #    (make sure `img` here is your OpenCV BGR image)
+    layout_started = time.perf_counter()
 
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     _, bw = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
@@ -149,77 +1550,146 @@ def advanced_cells_with_rectangles(img):
         if rw < w//20 or rh < h//30:
             continue
         rects.append((x, y, rw, rh))
+    ocr_stage_seconds.observe("layout", time.perf_counter() - layout_started)
 
-    # === DEBUG VISUALIZATION START ===
-    # draw all the rects you’ve kept onto a copy of the image
-    debug_img = img.copy()
-    for (x, y, rw, rh) in rects:
-        cv2.rectangle(debug_img, (x, y), (x+rw, y+rh), (0,255,0), 2)
-    # save to a temp file so you can inspect it
-    debug_path = f"/tmp/cell_debug_{uuid.uuid4().hex[:8]}.png"
-    cv2.imwrite(debug_path, debug_img)
-    print("🛠️  Debug cell map written to:", debug_path)
-    # === DEBUG VISUALIZATION END ===    
+    # debug: cell map with every kept rect outlined (only for captured requests)
+    debug_sink.capture("cell_map", img, rects)
 
-    
-    
     # if we found **no** real rectangles, fall back
     if not rects:
-        print("⚠️  No rectangles detected, falling back to simple_cells")
-        return simple_cells(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        logger.info("⚠️ No ruled cells detected, falling back to simple_cells")
+        return simple_cells(to_rgb(img), cls)
 
     # 7) sort the rectangles top→bottom, left→right
     rects.sort(key=lambda r: (r[1], r[0]))
 
-    # 8) do one OCR pass and map each snippet into its containing rect
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    raw = get_ocr_model().ocr(rgb, cls=True)[0]
-    cells = []
-    for box, (text, conf) in raw:
-        raw_text = text.strip()
-        # if not text.strip(): 
-        #     continue
-        if not raw_text:
-            continue
-        cleaned = fix_diameter(raw_text)
-        mx = int((box[0][0] + box[2][0]) / 2)
-        my = int((box[0][1] + box[2][1]) / 2)
-        # find which rectangle contains this midpoint
-        for idx, (x, y, rw, rh) in enumerate(rects):
-            if x <= mx < x+rw and y <= my < y+rh:
-                cells.append((idx, mx, my, cleaned, conf))
-                break
+    # 8) do one OCR pass and map each snippet's midpoint into its containing rect
+    rgb = to_rgb(img)
+    dets, texts = detections_from_raw(ocr_image(rgb, cls))
+    with ocr_stage_seconds.time("postprocess"):
+        rect_ids = RectIndex(rects).lookup(dets["cx"], dets["cy"])
 
-    # 9) for each rect‐index, collect its bits, sort by x (then y), glue text
-    out = []
-    for i, (x, y, rw, rh) in enumerate(rects):
-        bucket = [(mx, my, t, c) for (idx, mx, my, t, c) in cells if idx == i]
-        if not bucket:
-            out.append({"text": "", "confidence": 0})
-            continue
-        # reading order inside a cell: left→right, top→bottom
-        bucket.sort(key=lambda e: (e[1], e[0]))
-        joined = " ".join(e[2] for e in bucket)
-        conf   = min(e[3] for e in bucket)
-        out.append({"text": joined, "confidence": conf})
+        # 9) for each rect‐index, glue its bits in reading order (top→bottom, left→right)
+        out = [{"text": "", "confidence": 0} for _ in rects]
+        for i, cell in join_groups(rect_ids, dets, texts, clean=fix_diameter):
+            out[i] = cell
 
     return out
 
 
-def advanced_cells(img):
+# Find the cells of a ruled table in a BGR image: the regions enclosed by its
+# horizontal + vertical lines. Returns (x, y, w, h) sorted top→bottom, left→right.
+def find_grid_cells(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, bw = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
+    h, w = img.shape[:2]
+
+    # Only runs much longer than any glyph stroke survive the opening, so text never
+    # counts as ruling; narrow columns (a quantity column is a few digits wide) still
+    # need at least GRID_MIN_LINE px, or up to half the image side, to qualify
+    hk = max(w // 15, min(w // 2, GRID_MIN_LINE))
+    vk = max(h // 15, min(h // 2, GRID_MIN_LINE))
+    # thickening across the line direction first keeps slightly skewed rules continuous
+    horiz = cv2.morphologyEx(cv2.dilate(bw, np.ones((3, 1), np.uint8)), cv2.MORPH_OPEN,
+                             cv2.getStructuringElement(cv2.MORPH_RECT, (hk, 1)))
+    vert = cv2.morphologyEx(cv2.dilate(bw, np.ones((1, 3), np.uint8)), cv2.MORPH_OPEN,
+                            cv2.getStructuringElement(cv2.MORPH_RECT, (1, vk)))
+    # OR (not AND) the strokes so the full ruling is kept, then close small breaks
+    ruling = cv2.dilate(cv2.bitwise_or(horiz, vert), np.ones((3,3), np.uint8), iterations=1)
+
+    # every region of non-ruling pixels is a candidate cell; label 0 is the ruling itself
+    _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(ruling), connectivity=4)
+    rects = []
+    for x, y, rw, rh, area in stats[1:]:
+        # too small to hold a text line, or far from rectangular (e.g. the page around
+        # the table); skewed cells fill a bit less of their bounding box
+        if rw < GRID_MIN_CELL or rh < GRID_MIN_CELL or area < 0.5 * rw * rh:
+            continue
+        rects.append((int(x), int(y), int(rw), int(rh)))
+    rects.sort(key=lambda r: (r[1], r[0]))
+    return rects
+
+
+# Split a binarized cell into text-line row ranges using its horizontal ink profile
+def split_text_lines(bw_cell, min_gap=2):
+    rows = np.flatnonzero(bw_cell.any(axis=1))
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > min_gap)
+    starts = np.r_[rows[0], rows[breaks + 1]]
+    ends = np.r_[rows[breaks], rows[-1]] + 1
+    return list(zip(starts, ends))
+
+
+def grid_cells(img, cls=None):
+    """
+    Grid-first table OCR on a BGR image: find the cells from the ruling lines,
+    skip the blank ones by ink density, and recognize every text line inside
+    the remaining cells as one batch, with no detection pass.
+    Returns one {text, confidence} per cell, top→bottom, left→right.
+    """
+    with ocr_stage_seconds.time("layout"):
+        rects = find_grid_cells(img)
+    # a single region means there is no ruling at all
+    if len(rects) < 2:
+        logger.info("⚠️ No ruled cells detected, falling back to simple_cells")
+        return simple_cells(to_rgb(img), cls)
+
+    debug_sink.capture("grid_cells", img, rects)
+
+    rgb = to_rgb(img)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, bw = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
+
+    crops, owners = [], []
+    for i, (x, y, rw, rh) in enumerate(rects):
+        # trim the ruling lines so they don't count as ink
+        pad = max(2, min(rw, rh) // 12)
+        inner = bw[y+pad:y+rh-pad, x+pad:x+rw-pad]
+        if inner.size == 0 or cv2.countNonZero(inner) < OCR_MIN_INK_DENSITY * inner.size:
+            continue
+        for top, bot in split_text_lines(inner):
+            if bot - top < 4:
+                continue  # specks, not text
+            cols = np.flatnonzero(inner[top:bot].any(axis=0))
+            # a little margin around the ink helps the recognizer
+            m = max(2, (bot - top) // 4)
+            y0, y1 = max(0, y+pad+top-m), min(img.shape[0], y+pad+bot+m)
+            x0, x1 = max(0, x+pad+cols[0]-m), min(img.shape[1], x+pad+cols[-1]+1+m)
+            crops.append(rgb[y0:y1, x0:x1])
+            owners.append(i)
+
+    logger.info(f"🔍 grid_cells: {len(rects)} cells, {len(set(owners))} with ink, {len(crops)} line crops")
+    rec_res, drop_score = recognize_crops(crops, cls)
+
+    lines = [[] for _ in rects]
+    for i, (text, conf) in zip(owners, rec_res):
+        text = text.strip()
+        if text and conf >= drop_score:
+            lines[i].append((fix_diameter(text), conf))
+
+    return [
+        {"text": " ".join(t for t, _ in cell), "confidence": min(c for _, c in cell)}
+        if cell else {"text": "", "confidence": 0}
+        for cell in lines
+    ]
+
+
+def advanced_cells(img, cls=None):
     # 1) Single OCR pass (RGB)
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    raw = get_ocr_model().ocr(rgb, cls=True)[0]
+    rgb = to_rgb(img)
+    raw = ocr_image(rgb, cls)
+    dets, texts = detections_from_raw(raw)
 
     # 2) Estimate a “typical” line‐height and set merge_thresh = max(median_h, 20px)
-    heights = [abs(box[2][1] - box[0][1]) for box, (txt, _) in raw if txt.strip()]
-    if heights:
-        median_h = sorted(heights)[len(heights)//2]
+    if len(dets):
+        median_h = np.sort(dets["height"])[len(dets)//2]
         merge_thresh = max(median_h, 20)
     else:
         merge_thresh = 20
 
     # 3) Binarize & invert for horizontal‐line detection
+    layout_started = time.perf_counter()
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     _, bw = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
 
@@ -251,51 +1721,19 @@ def advanced_cells(img):
         else:
             clusters[-1].append(y)
     row_bounds = [int(sum(c)/len(c)) for c in clusters]
+    ocr_stage_seconds.observe("layout", time.perf_counter() - layout_started)
 
     # 7) Fallback: if we found no interior lines, drop back to your old simple_cells
+    #    (reusing the OCR pass we already have)
     if lines is None or len(row_bounds) < 2:
-        return simple_cells(rgb)
+        return simple_cells_from_raw(raw)
 
-    # 8) Bucket the same OCR boxes into those horizontal bands
-    cells = []
-    for box, (txt, conf) in raw:
-        if not txt.strip():
-            continue
-        x = int((box[0][0] + box[2][0]) / 2)
-        y = int((box[0][1] + box[2][1]) / 2)
-        cells.append({"x": x, "y": y, "text": txt.strip(), "conf": conf})
-
-    rows = []
-    # head (above the first grid line)
-    head = [c for c in cells if c["y"] < row_bounds[0]]
-    if head:
-        head.sort(key=lambda c: (c["y"], c["x"]))
-        rows.append({
-            "text": " ".join(c["text"] for c in head),
-            "confidence": min(c["conf"] for c in head)
-        })
-
-    # middle bands
-    for top, bot in zip(row_bounds, row_bounds[1:]):
-        band = [c for c in cells if top <= c["y"] < bot]
-        if not band:
-            continue
-        band.sort(key=lambda c: (c["y"], c["x"]))
-        rows.append({
-            "text": " ".join(c["text"] for c in band),
-            "confidence": min(c["conf"] for c in band)
-        })
-
-    # tail (below the last grid line)
-    tail = [c for c in cells if c["y"] >= row_bounds[-1]]
-    if tail:
-        tail.sort(key=lambda c: (c["y"], c["x"]))
-        rows.append({
-            "text": " ".join(c["text"] for c in tail),
-            "confidence": min(c["conf"] for c in tail)
-        })
-
-    return rows
+    # 8) Bucket the same OCR boxes into those horizontal bands:
+    #    band 0 is the head (above the first grid line), band len(row_bounds)
+    #    the tail (below the last one), everything else sits between two lines
+    with ocr_stage_seconds.time("postprocess"):
+        bands = np.searchsorted(np.asarray(row_bounds), dets["cy"], side="right")
+        return [row for _, row in join_groups(bands, dets, texts)]
 
 # Working fine except multiline text extraction
 # def advanced_cells(img):
@@ -504,9 +1942,55 @@ async def health_check():
     return {
         "status": "ok", 
         "model_files_exist": model_paths_exist,
-        "paddle_home": PADDLE_HOME
+        "paddle_home": PADDLE_HOME,
+        "ocr_execution": OCR_EXECUTION,
+        "ocr_engine": OCR_ENGINE,
+        "ocr_pool": ocr_pool.stats(),
+        "ocr_cache": ocr_cache.stats(),
+        "ocr_queue": ocr_queue.stats(),
+        "ocr_jobs": ocr_jobs.stats(),
+        "glide": glide.stats(),
+        "drawings_mirror": drawings_mirror.stats(),
+        "glide_write_behind": GLIDE_WRITE_BEHIND,
+        "warmup": ocr_warmup.state,
+        "orientation": dict(orientation_stats)
     }
 
+# Readiness, separate from liveness (/health): 503 until the startup warm-up has loaded
+# the engines and run them once, so a load balancer only routes traffic to a warm instance
+@app.get("/ready")
+async def readiness_check():
+    stats = ocr_warmup.stats()
+    if not ocr_warmup.ready:
+        return JSONResponse(status_code=503, content=stats)
+    return stats
+
+# Numeric fields of a stats() dict as Prometheus gauges
+def render_gauges(prefix, stats):
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f"{prefix}_{key} {value}")
+    return lines
+
+# Prometheus-style metrics: stage/Glide/request latency histograms plus pool, queue and cache gauges
+@app.get("/metrics")
+async def metrics():
+    parts = [h.render() for h in (ocr_stage_seconds, glide_request_seconds, http_request_seconds)]
+    parts += render_gauges("ocr_pool", ocr_pool.stats())
+    parts += render_gauges("ocr_queue", ocr_queue.stats())
+    parts += render_gauges("ocr_jobs", ocr_jobs.stats())
+    parts += render_gauges("glide", glide.stats())
+    parts += render_gauges("drawings_mirror", drawings_mirror.stats())
+    parts += render_gauges("ocr_warmup", ocr_warmup.stats())
+    cache_stats = ocr_cache.stats()
+    parts += render_gauges("ocr_cache", cache_stats)
+    parts += [f'ocr_cache_hits{{tier="{tier}"}} {n}' for tier, n in cache_stats["hits"].items()]
+    parts += [f'ocr_orientation_total{{decision="{k}"}} {n}' for k, n in orientation_stats.items()]
+    return Response(content="\n".join(parts) + "\n", media_type="text/plain; version=0.0.4")
+
 # Test endpoint
 @app.get("/test")
 async def test_endpoint():
@@ -517,50 +2001,185 @@ async def test_endpoint():
 async def head_endpoint():
     return JSONResponse(content={"status": "ok"})
 
+class UploadTooLarge(Exception):
+    """Raised when an upload is bigger than OCR_MAX_UPLOAD_MB allows."""
+
+
+def max_upload_bytes():
+    return int(OCR_MAX_UPLOAD_MB * 1024 * 1024)
+
+# Reject a request up front when its declared Content-Length is already over `limit`
+def check_content_length(request, limit):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise UploadTooLarge()
+
+# The same request, but its body stream raises UploadTooLarge once more than `limit`
+# bytes have arrived. The multipart parser spools uploads to disk as it reads, so this
+# is what stops a chunked upload (no Content-Length to check) early.
+def limit_body(request, limit):
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise UploadTooLarge()
+        return message
+
+    return Request(request.scope, receive)
+
+# Read a raw request body, giving up as soon as it grows past `limit`
+async def read_body_limited(request, limit):
+    chunks, total = [], 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > limit:
+            raise UploadTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+# Read a multipart file field; the form parser has already spooled it to disk
+# (within the request's limit_body budget)
+async def read_upload_limited(upload, limit):
+    if upload.size is not None and upload.size > limit:
+        raise UploadTooLarge()
+    image_bytes = await upload.read(limit + 1)
+    if len(image_bytes) > limit:
+        raise UploadTooLarge()
+    return image_bytes
+
+def upload_too_large_response():
+    logger.warning("Rejecting upload larger than the configured limit")
+    return JSONResponse(
+        status_code=413,
+        content={"error": f"Image too large (limit {OCR_MAX_UPLOAD_MB:g} MB per image)"}
+    )
+
+# EXIF orientations 5-8 are rotated by 90°; cv2.imdecode applies them, so width and height swap
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Image (width, height) from the file header alone, without decoding pixels, in the
+# orientation cv2.imdecode returns (EXIF orientation applied)
+def image_size(image_bytes):
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            width, height = im.size
+            if im.getexif().get(EXIF_ORIENTATION_TAG) in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+    except Exception:
+        return None
+
+# Pick the IMREAD_* flag: full resolution, or a 1/2, 1/4, 1/8 reduced decode
+# when the image is far bigger than the pipeline will ever use
+def decode_flag(image_bytes):
+    size = image_size(image_bytes)
+    if not size or OCR_MAX_DECODE_SIDE <= 0:
+        return cv2.IMREAD_COLOR
+    longest = max(size)
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if longest / factor >= OCR_MAX_DECODE_SIDE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+# Decode uploaded bytes into an OpenCV BGR image (None if not an image)
+def decode_image(image_bytes):
+    with ocr_stage_seconds.time("decode"):
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        return cv2.imdecode(nparr, decode_flag(image_bytes))
+
 # Main OCR endpoint
 @app.post("/")
 async def ocr_endpoint(request: Request):
     try:
         logger.info(f"Received OCR request with Content-Type: {request.headers.get('content-type')}")
 
-        # 1) Get form + fields
-        form = await request.form()
-        logger.info(f"Received form data with keys: {list(form.keys())}")
-
-        if "image" not in form:
-            logger.warning("Missing image parameter in request")
-            return JSONResponse(status_code=400, content={"error": "Missing image parameter"})
-        if "mode" not in form:
-            logger.warning("Missing mode parameter in request")
-            return JSONResponse(status_code=400, content={"error": "Missing mode parameter"})
-        # ← NEW: optional “column” tag
-        column_id = form.get("column", None)
-
-        image_file = form["image"]
-        mode       = form["mode"]
-        logger.info(f"Processing request in mode: {mode}, image filename: {image_file.filename}, column: {column_id}")
-
-        # 2) Read the bytes
-        image_bytes = await image_file.read()
-
-        # 3) Decode once to a CV2 image
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img   = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        # 4) Dispatch to the right OCR routine under a worker thread
+        limit = max_upload_bytes()
+        # multipart framing adds a little on top of the image itself
+        body_limit = limit + 64 * 1024
+        check_content_length(request, body_limit)
+
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("image/"):
+            # 1) Raw image body: mode/column come from the query string
+            mode      = request.query_params.get("mode")
+            column_id = request.query_params.get("column")
+            if not mode:
+                logger.warning("Missing mode parameter in request")
+                return JSONResponse(status_code=400, content={"error": "Missing mode parameter"})
+            logger.info(f"Processing raw {content_type} request in mode: {mode}, column: {column_id}")
+
+            cls_option = request.query_params.get("cls")
+            rois_option = request.query_params.get("rois")
+
+            # 2) Read the bytes
+            with ocr_stage_seconds.time("upload_read"):
+                image_bytes = await read_body_limited(request, limit)
+        else:
+            # 1) Get form + fields
+            form = await limit_body(request, body_limit).form()
+            logger.info(f"Received form data with keys: {list(form.keys())}")
+
+            if "image" not in form:
+                logger.warning("Missing image parameter in request")
+                return JSONResponse(status_code=400, content={"error": "Missing image parameter"})
+            if "mode" not in form:
+                logger.warning("Missing mode parameter in request")
+                return JSONResponse(status_code=400, content={"error": "Missing mode parameter"})
+            # ← NEW: optional “column” tag
+            column_id = form.get("column", None)
+            # optional angle-classifier override: auto / on / off
+            cls_option = form.get("cls", None)
+            # roi mode: JSON object of region name -> [x, y, w, h], in the displayed
+            # (EXIF-rotated) orientation
+            rois_option = form.get("rois", None)
+
+            image_file = form["image"]
+            mode       = form["mode"]
+            logger.info(f"Processing request in mode: {mode}, image filename: {image_file.filename}, column: {column_id}")
+
+            # 2) Read the bytes
+            with ocr_stage_seconds.time("upload_read"):
+                image_bytes = await read_upload_limited(image_file, limit)
+
+        cls = parse_cls_option(cls_option)
+
+        rects = None
+        if mode == "roi":
+            size = image_size(image_bytes)
+            if size is None:
+                return JSONResponse(status_code=400, content={"error": "Could not decode image"})
+            try:
+                rects = parse_rois(rois_option, size)
+            except (TypeError, ValueError) as e:
+                return JSONResponse(status_code=400, content={"error": f"Invalid rois: {e}"})
+            # the regions are part of what was asked, so they're part of the cache key
+            column_id = json.dumps(rects, sort_keys=True)
+
+        # 3) Dispatch to the right OCR routine under a worker thread
         def do_ocr():
+            # decode once to a CV2 image (reduced resolution for huge uploads)
+            img = decode_image(image_bytes)
+            if img is None:
+                raise ValueError("Could not decode image")
             # quick mode: just raw text join
             if mode == "quick":
-                rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                rgb = to_rgb(img)
                 # reuse simple_cells to get list of dicts
-                cells = simple_cells(rgb)
+                cells = run_cells(simple_cells, rgb, cls)
                 extracted_text = "\n".join(c["text"] for c in cells)
                 return {"mode": mode, "extracted_text": extracted_text, "cells": cells}
 
             # table mode: choose by column tag
             elif mode == "table":
-                rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                table_cells = simple_cells(rgb)
+                rgb = to_rgb(img)
+                table_cells = run_cells(simple_cells, rgb, cls)
                 logger.info(f"Using simple_cells for column: {column_id}")
                 return {"mode": mode, "table": table_cells}
                 # # quantity gets the old per‐line logic
@@ -572,14 +2191,41 @@ async def ocr_endpoint(request: Request):
                 #     table_cells = advanced_cells_with_rectangles(img)
                 # return {"mode": mode, "table": table_cells}
 
+            # roi mode: one full sheet, one OCR pass, cells split per named region
+            elif mode == "roi":
+                # regions are in uploaded pixels; huge uploads may have been decoded smaller
+                factor = img.shape[1] / size[0]
+                scaled = {
+                    name: tuple(int(round(v * factor)) for v in rect) for name, rect in rects.items()
+                }
+                columns = run_cells(roi_cells, to_rgb(img), scaled, cls)
+                return {"mode": mode, "columns": columns}
+
+            # grid mode: recognize straight from the ruled cells, no detection pass
+            elif mode == "grid":
+                table_cells = run_cells(grid_cells, img, cls)
+                return {"mode": mode, "table": table_cells}
+
             else:
                 raise ValueError(f"Invalid mode provided: {mode}")
 
-        # 5) Run OCR with timeout protection
+        # 4) Run OCR on the bounded queue with timeout protection
+        #    (re-uploads of the same image come from the cache)
         try:
-            result = await asyncio.to_thread(do_ocr)
+            cache_key = ocr_cache_key(image_bytes, mode, column_id, cls)
+            result = await ocr_cache.get_or_compute(
+                cache_key,
+                lambda: ocr_queue.run(do_ocr, request=request, timeout=OCR_DEADLINE_SECONDS)
+            )
             return result
 
+        except OCRQueueFull as e:
+            return queue_full_response(e)
+
+        except OCRJobCancelled:
+            logger.info("Client disconnected, OCR job dropped")
+            return JSONResponse(status_code=499, content={"error": "Client closed request"})
+
         except asyncio.TimeoutError:
             logger.error("OCR processing timed out")
             return JSONResponse(
@@ -587,6 +2233,9 @@ async def ocr_endpoint(request: Request):
                 content={"error": "Processing timed out. Try with a smaller image."}
             )
 
+    except UploadTooLarge:
+        return upload_too_large_response()
+
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
@@ -596,6 +2245,525 @@ async def ocr_endpoint(request: Request):
             content={"error": f"Server error: {str(e)}"}
         )
 
+# Multi-column table endpoint: every column image in one multipart request.
+# Each file field is named after its column (e.g. PartNumber, Quantity, ...).
+@app.post("/table")
+async def table_endpoint(request: Request):
+    try:
+        limit = max_upload_bytes()
+        body_limit = limit * OCR_MAX_TABLE_COLUMNS + 64 * 1024
+        check_content_length(request, body_limit)
+
+        form = await limit_body(request, body_limit).form(max_files=OCR_MAX_TABLE_COLUMNS)
+        uploads = [(key, value) for key, value in form.multi_items() if isinstance(value, UploadFile)]
+        logger.info(f"Received table request with columns: {[key for key, _ in uploads]}")
+
+        if not uploads:
+            return JSONResponse(status_code=400, content={"error": "No column images provided"})
+
+        columns = [key for key, _ in uploads]
+        cls = parse_cls_option(form.get("cls"))
+        if len(set(columns)) != len(columns):
+            return JSONResponse(status_code=400, content={"error": "Duplicate column names in request"})
+
+        # 1) Read every column; columns seen before are answered from the cache
+        with ocr_stage_seconds.time("upload_read"):
+            contents = [await read_upload_limited(upload, limit) for _, upload in uploads]
+        keys = [ocr_cache_key(image_bytes, "table", column, cls) for column, image_bytes in zip(columns, contents)]
+        cached = await asyncio.gather(*(asyncio.to_thread(ocr_cache.get, key) for key in keys))
+        results = {column: hit["table"] for column, hit in zip(columns, cached) if hit is not None}
+        pending = [i for i, hit in enumerate(cached) if hit is None]
+
+        # 2) Decode + detect the remaining columns as concurrent queue jobs,
+        #    all sharing one request deadline
+        def load_and_detect(image_bytes):
+            img = decode_image(image_bytes)
+            if img is None:
+                return None
+            rgb = to_rgb(img)
+            if OCR_EXECUTION == "process":
+                # the whole column runs in one worker process; cross-column
+                # recognition batching only applies in thread mode
+                return run_cells(simple_cells, rgb, cls)
+            return detect_and_crop(rgb)
+
+        deadline = time.monotonic() + OCR_DEADLINE_SECONDS
+        jobs = [
+            asyncio.create_task(ocr_queue.run(load_and_detect, contents[i], request=request, timeout=OCR_DEADLINE_SECONDS))
+            for i in pending
+        ]
+        try:
+            detected = await asyncio.gather(*jobs)
+        except BaseException:
+            for job in jobs:
+                job.cancel()
+            raise
+
+        bad = [columns[i] for i, det in zip(pending, detected) if det is None]
+        if bad:
+            return JSONResponse(status_code=400, content={"error": f"Could not decode image for column(s): {', '.join(bad)}"})
+
+        if OCR_EXECUTION == "process":
+            cells_per_image = detected
+        else:
+            boxes_per_image = [boxes for boxes, _ in detected]
+            crops_per_image = [crops for _, crops in detected]
+
+            # 3) One recognition batch for all columns
+            raws = await ocr_queue.run(
+                recognize_batch, boxes_per_image, crops_per_image, cls,
+                request=request, timeout=max(0.0, deadline - time.monotonic())
+            )
+            cells_per_image = [simple_cells_from_raw(raw) for raw in raws]
+
+        for i, cells in zip(pending, cells_per_image):
+            results[columns[i]] = cells
+            await asyncio.to_thread(ocr_cache.put, keys[i], {"mode": "table", "table": cells})
+
+        return {
+            "mode": "table",
+            "columns": {column: results[column] for column in columns}
+        }
+
+    except UploadTooLarge:
+        return upload_too_large_response()
+
+    except OCRQueueFull as e:
+        return queue_full_response(e)
+
+    except OCRJobCancelled:
+        logger.info("Client disconnected, table job dropped")
+        return JSONResponse(status_code=499, content={"error": "Client closed request"})
+
+    except asyncio.TimeoutError:
+        logger.error("Table OCR processing timed out")
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Processing timed out. Try with smaller images."}
+        )
+
+    except Exception as e:
+        import traceback
+        tb = traceback.format_exc()
+        logger.error(f"Error processing table request: {e}\n{tb}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Server error: {str(e)}"}
+        )
+
+# One column of a table: decoded once, then cells from the detector ("table") or from
+# the ruled grid ("grid"). Runs on an OCR worker.
+def ocr_column(image_bytes, mode, cls):
+    img = decode_image(image_bytes)
+    if img is None:
+        raise ValueError("Could not decode image")
+    if mode == "grid":
+        return run_cells(grid_cells, img, cls)
+    return run_cells(simple_cells, to_rgb(img), cls)
+
+
+# A background OCR job: its parts (columns, or pages of a PDF), their results, and the
+# ordered event log that /jobs/{id}/events streams (and replays from Last-Event-ID).
+class OCRJob:
+    def __init__(self, job_id, mode, cls, parts, kind="columns"):
+        self.id = job_id
+        self.mode = mode
+        self.cls = cls
+        self.kind = kind  # "columns" or "pages"
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.parts = {part: {"status": "pending"} for part in parts}
+        self.events = []
+        self._changed = asyncio.Event()
+        self.task = None
+
+    def publish(self, event, data):
+        self.events.append((event, data))
+        # wake every stream waiting on the old event, then start a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def summary(self, with_results=True):
+        parts = self.parts if with_results else {
+            part: {"status": state["status"]} for part, state in self.parts.items()
+        }
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "mode": self.mode,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            self.kind: parts,
+        }
+
+    async def stream(self, last_event_id=-1):
+        next_id = last_event_id + 1
+        while True:
+            while next_id < len(self.events):
+                event, data = self.events[next_id]
+                yield f"id: {next_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                next_id += 1
+            if self.finished:
+                return
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"  # keeps proxies from closing an idle stream
+
+
+# Runs `fn(*args)` on the OCR queue through the result cache, waiting for room when the
+# queue is full rather than failing, until `deadline` (a time.monotonic() value)
+async def run_cached_until(key, mode, deadline, fn, *args):
+    async def compute():
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                cells = await ocr_queue.run(fn, *args, timeout=remaining)
+                # cached in the same shape POST / and /table use
+                return {"mode": mode, "table": cells}
+            except OCRQueueFull as e:
+                await asyncio.sleep(min(e.retry_after, remaining))
+
+    return (await ocr_cache.get_or_compute(key, compute))["table"]
+
+
+# Async OCR jobs. Each part is OCR'd as its own queue job (through the result cache), so
+# results are published as soon as that part is done rather than when the slowest one is.
+# A job may take OCR_JOB_DEADLINE_SECONDS in all, waiting for queue room included.
+# Finished jobs are kept for OCR_JOB_TTL_SECONDS, and at most OCR_JOB_MAX_ITEMS are kept in all.
+class OCRJobStore:
+    def __init__(self, max_active, max_items, ttl):
+        self.max_active = max_active
+        self.max_items = max_items
+        self.ttl = ttl
+        self.jobs = OrderedDict()
+        self.submitted = 0
+        self.rejected = 0
+
+    def active(self):
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and (now - job.finished_at > self.ttl or len(self.jobs) > self.max_items):
+                del self.jobs[job_id]
+
+    def submit(self, job, work):
+        """Start `work(job, deadline)` in the background; raises OCRQueueFull when too many jobs are unfinished."""
+        self.prune()
+        if self.active() >= self.max_active:
+            self.rejected += 1
+            raise OCRQueueFull(ocr_queue.retry_after())
+        self.jobs[job.id] = job
+        self.submitted += 1
+        job.task = asyncio.create_task(self.run(job, work))
+        return job
+
+    def get(self, job_id):
+        self.prune()
+        return self.jobs.get(job_id)
+
+    async def run(self, job, work):
+        job.status = "running"
+        job.publish("status", {"status": "running"})
+        try:
+            await work(job, time.monotonic() + OCR_JOB_DEADLINE_SECONDS)
+            failed = [part for part, state in job.parts.items() if state["status"] == "error"]
+            job.status = "failed" if job.parts and len(failed) == len(job.parts) else "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.status = "failed"
+            job.publish("error", {"error": str(e)})
+        finally:
+            job.finished_at = time.time()
+            job.publish("done", {"status": job.status})
+
+    def stats(self):
+        counts = Counter(job.status for job in self.jobs.values())
+        return {
+            "active": self.active(),
+            "stored": len(self.jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            **{f"status_{status}": n for status, n in counts.items()},
+        }
+
+# Job work for column images: every column concurrently, each published when done
+def column_job_work(uploads):
+    async def work(job, deadline):
+        async def one(column, image_bytes):
+            try:
+                key = ocr_cache_key(image_bytes, job.mode, column, job.cls)
+                cells = await run_cached_until(key, job.mode, deadline, ocr_column, image_bytes, job.mode, job.cls)
+                job.parts[column] = {"status": "done", "cells": cells}
+                job.publish("column", {"column": column, "cells": cells})
+            except Exception as e:
+                error = "Processing timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+                logger.error(f"Job {job.id} column {column} failed: {error}")
+                job.parts[column] = {"status": "error", "error": error}
+                job.publish("column_error", {"column": column, "error": error})
+
+        await asyncio.gather(*(one(column, image_bytes) for column, image_bytes in uploads))
+    return work
+
+ocr_jobs = OCRJobStore(OCR_JOB_MAX_ACTIVE, OCR_JOB_MAX_ITEMS, OCR_JOB_TTL_SECONDS)
+
+# Submit an async OCR job: the same multipart body as /table (one file field per column,
+# optional cls), plus an optional mode of "table" (default) or "grid". Answers 202 at once.
+@app.post("/jobs")
+async def submit_job(request: Request):
+    try:
+        limit = max_upload_bytes()
+        body_limit = limit * OCR_MAX_TABLE_COLUMNS + 64 * 1024
+        check_content_length(request, body_limit)
+
+        form = await limit_body(request, body_limit).form(max_files=OCR_MAX_TABLE_COLUMNS)
+        uploads = [(key, value) for key, value in form.multi_items() if isinstance(value, UploadFile)]
+        if not uploads:
+            return JSONResponse(status_code=400, content={"error": "No column images provided"})
+        columns = [key for key, _ in uploads]
+        if len(set(columns)) != len(columns):
+            return JSONResponse(status_code=400, content={"error": "Duplicate column names in request"})
+        mode = form.get("mode") or "table"
+        if mode not in ("table", "grid"):
+            return JSONResponse(status_code=400, content={"error": f"Invalid mode provided: {mode}"})
+        cls = parse_cls_option(form.get("cls"))
+
+        with ocr_stage_seconds.time("upload_read"):
+            contents = [await read_upload_limited(upload, limit) for _, upload in uploads]
+
+        job = ocr_jobs.submit(
+            OCRJob(uuid.uuid4().hex, mode, cls, columns),
+            column_job_work(list(zip(columns, contents)))
+        )
+        logger.info(f"Queued OCR job {job.id} for columns: {columns}")
+        return JSONResponse(status_code=202, content={
+            **job.summary(with_results=False),
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+        })
+
+    except UploadTooLarge:
+        return upload_too_large_response()
+
+    except OCRQueueFull as e:
+        return queue_full_response(e)
+
+    except Exception as e:
+        import traceback
+        tb = traceback.format_exc()
+        logger.error(f"Error submitting OCR job: {e}\n{tb}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Server error: {str(e)}"}
+        )
+
+# Job status, with the cells of every column (or page) finished so far
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = ocr_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job"})
+    return job.summary()
+
+# Server-sent events: "status", then a "column"/"page" (or "column_error"/"page_error") event
+# per part as it finishes, then "done". Reconnecting with Last-Event-ID resumes after that event.
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    job = ocr_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job"})
+    try:
+        last_event_id = int(request.headers.get("last-event-id", -1))
+    except ValueError:
+        last_event_id = -1
+    return StreamingResponse(
+        job.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# PDF pages are opened and rendered on their own small pool so OCR workers stay on OCR.
+# Each call opens the document itself: PyMuPDF documents can't be shared across threads.
+pdf_render_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, OCR_PDF_RENDER_WORKERS), thread_name_prefix="pdf"
+)
+
+class PDFSupportMissing(Exception):
+    pass
+
+def open_pdf(pdf_bytes):
+    try:
+        import fitz  # PyMuPDF; only needed for PDF input
+    except ImportError:
+        raise PDFSupportMissing("PDF input needs PyMuPDF (pip install pymupdf)")
+    return fitz.open(stream=pdf_bytes, filetype="pdf")
+
+def pdf_page_count(pdf_bytes):
+    with open_pdf(pdf_bytes) as doc:
+        return doc.page_count
+
+# "1-3,5" -> [0, 1, 2, 4]; empty means every page
+def parse_page_ranges(spec, page_count):
+    if not spec:
+        return list(range(page_count))
+    pages = set()
+    for part in str(spec).split(","):
+        first, _, last = part.strip().partition("-")
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Page range {part.strip()} is outside 1-{page_count}")
+        pages.update(range(first - 1, last))
+    return sorted(pages)
+
+# One cell per line of the page's text layer, top to bottom, like simple_cells
+def pdf_text_cells(words):
+    lines = {}
+    for x0, y0, x1, y1, text, block, line, _ in words:
+        entry = lines.setdefault((block, line), [y0, x0, []])
+        entry[2].append(text)
+    ordered = sorted(lines.values(), key=lambda entry: (round(entry[0]), entry[1]))
+    return [{"text": " ".join(texts), "confidence": 1.0} for _, _, texts in ordered]
+
+def load_pdf_page(pdf_bytes, index, dpi):
+    """
+    ("text", cells) when the page has a usable text layer, otherwise ("ocr", rgb) with
+    the page rendered at `dpi` (reduced so its longer side stays under 2 * OCR_MAX_DECODE_SIDE).
+    """
+    with ocr_stage_seconds.time("pdf_render"), open_pdf(pdf_bytes) as doc:
+        page = doc[index]
+        words = page.get_text("words")
+        if sum(len(w[4]) for w in words) >= OCR_PDF_MIN_TEXT_CHARS:
+            return "text", pdf_text_cells(words)
+
+        import fitz
+        zoom = dpi / 72
+        longest = max(page.rect.width, page.rect.height) * zoom
+        if longest > 2 * OCR_MAX_DECODE_SIDE:
+            zoom *= 2 * OCR_MAX_DECODE_SIDE / longest
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+        rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+        return "ocr", rgb[:, :pix.width * 3].reshape(pix.height, pix.width, 3).copy()
+
+# Job work for a PDF: pages are rendered on the PDF pool, at most two per render worker
+# held in memory at a time, and OCR'd pages go through the cache and the OCR queue.
+# Each page is published ("page" event) as soon as it's done.
+def pdf_job_work(pdf_bytes, pages, dpi):
+    async def work(job, deadline):
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(2 * max(1, OCR_PDF_RENDER_WORKERS))
+
+        async def one(index):
+            part = f"page-{index + 1}"
+            async with in_flight:
+                try:
+                    key = ocr_cache_key(pdf_bytes, job.mode, f"{part}@{dpi:g}", job.cls)
+                    hit = await asyncio.to_thread(ocr_cache.get, key)
+                    if hit is not None:
+                        source, cells = "ocr", hit["table"]
+                    else:
+                        source, data = await loop.run_in_executor(
+                            pdf_render_executor, load_pdf_page, pdf_bytes, index, dpi
+                        )
+                        if source == "text":
+                            cells = data
+                        else:
+                            cells = await run_cached_until(
+                                key, job.mode, deadline, run_cells, simple_cells, data, job.cls
+                            )
+                        del data
+                    job.parts[part] = {"status": "done", "source": source, "cells": cells}
+                    job.publish("page", {"page": index + 1, "source": source, "cells": cells})
+                except Exception as e:
+                    error = "Processing timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+                    logger.error(f"Job {job.id} {part} failed: {error}")
+                    job.parts[part] = {"status": "error", "error": error}
+                    job.publish("page_error", {"page": index + 1, "error": error})
+
+        await asyncio.gather(*(one(index) for index in pages))
+    return work
+
+# Submit a PDF as an async OCR job. Multipart fields: file (the PDF), optional dpi
+# (default OCR_PDF_DPI), pages ("1-3,5"; default all) and cls. Pages with a text layer
+# are read from it directly; the rest are rendered and OCR'd like table-mode images.
+# Progress comes through /jobs/{id} and /jobs/{id}/events ("page" events).
+@app.post("/pdf")
+async def submit_pdf(request: Request):
+    try:
+        limit = max_upload_bytes()
+        body_limit = limit + 64 * 1024
+        check_content_length(request, body_limit)
+
+        form = await limit_body(request, body_limit).form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            return JSONResponse(status_code=400, content={"error": "Missing file parameter"})
+        try:
+            dpi = float(form.get("dpi") or OCR_PDF_DPI)
+        except ValueError:
+            return JSONResponse(status_code=400, content={"error": "dpi must be a number"})
+        dpi = min(max(dpi, 72.0), OCR_PDF_MAX_DPI)
+        cls = parse_cls_option(form.get("cls"))
+
+        with ocr_stage_seconds.time("upload_read"):
+            pdf_bytes = await read_upload_limited(upload, limit)
+
+        try:
+            page_count = await asyncio.to_thread(pdf_page_count, pdf_bytes)
+            pages = parse_page_ranges(form.get("pages"), page_count)
+        except PDFSupportMissing:
+            raise
+        except Exception as e:
+            return JSONResponse(status_code=400, content={"error": f"Could not read PDF: {e}"})
+        if len(pages) > OCR_PDF_MAX_PAGES:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Too many pages ({len(pages)}); at most {OCR_PDF_MAX_PAGES} per request"}
+            )
+
+        job = ocr_jobs.submit(
+            OCRJob(uuid.uuid4().hex, "table", cls, [f"page-{i + 1}" for i in pages], kind="pages"),
+            pdf_job_work(pdf_bytes, pages, dpi)
+        )
+        logger.info(f"Queued PDF job {job.id}: {len(pages)} of {page_count} pages at {dpi:g} dpi")
+        return JSONResponse(status_code=202, content={
+            **job.summary(with_results=False),
+            "dpi": dpi,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+        })
+
+    except PDFSupportMissing as e:
+        return JSONResponse(status_code=501, content={"error": str(e)})
+
+    except UploadTooLarge:
+        return upload_too_large_response()
+
+    except OCRQueueFull as e:
+        return queue_full_response(e)
+
+    except Exception as e:
+        import traceback
+        tb = traceback.format_exc()
+        logger.error(f"Error submitting PDF job: {e}\n{tb}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Server error: {str(e)}"}
+        )
+
 # Extracts Drawing number from File Name
 def extract_drawing_number(url: str):
     if not url:
@@ -609,7 +2777,8 @@ async def update_last_ocr_bom_item_direct(row_id: str, new_last_item: int):
     try:
         print(f"🔄 Updating lastOcrBomItem to {new_last_item} for rowID: {row_id}")
         
-        update_body = {
+        # set-columns-in-row is idempotent, so a failed update can simply be sent again
+        await glide.post("/mutateTables", {
             "appID": GLIDE_APP_ID,
             "mutations": [{
                 "kind": "set-columns-in-row",
@@ -617,17 +2786,7 @@ async def update_last_ocr_bom_item_direct(row_id: str, new_last_item: int):
                 "columnValues": {"WddPP": new_last_item},
                 "rowID": row_id
             }]
-        }
-        
-        async with httpx.AsyncClient() as client:
-            update_res = await client.post(
-                "https://api.glideapp.io/api/function/mutateTables",
-                headers={"Authorization": f"Bearer {GLIDE_API_KEY}", "Content-Type": "application/json"},
-                json=update_body
-            )
-        
-        update_res.raise_for_status()
-        result = update_res.json()
+        }, "update_last_ocr_bom_item", idempotent=True)
         print(f"✅ Successfully updated lastOcrBomItem to {new_last_item}")
         return True
         
@@ -640,6 +2799,729 @@ GLIDE_API_KEY = "54333200-37b8-4742-929c-156d49cd7c64"
 GLIDE_APP_ID = "rIdnwOvTnxdsQUtlXKUB"
 GLIDE_TABLE = "native-table-unGdNRqsjTPlBDZB2629"
 
+# Glide API client settings. GLIDE_API_BASE can point at a local stand-in server for testing.
+GLIDE_API_BASE = os.environ.get("GLIDE_API_BASE", "https://api.glideapp.io/api/function")
+GLIDE_TIMEOUT_SECONDS = float(os.environ.get("GLIDE_TIMEOUT_SECONDS", 30))
+GLIDE_MAX_CONCURRENCY = int(os.environ.get("GLIDE_MAX_CONCURRENCY", 4))
+GLIDE_MAX_RETRIES = int(os.environ.get("GLIDE_MAX_RETRIES", 3))
+GLIDE_BACKOFF_SECONDS = float(os.environ.get("GLIDE_BACKOFF_SECONDS", 0.5))
+
+# Status codes Glide never applied a mutation for, so they are safe to resend;
+# a plain 500 may have half-applied a batch of add-row mutations and is only retried for queries
+GLIDE_RETRY_ALWAYS = {429, 502, 503, 504}
+
+# One pooled, keep-alive HTTP client shared by every Glide call for the life of the app.
+# Requests beyond GLIDE_MAX_CONCURRENCY wait their turn; 429/5xx responses are retried
+# with jittered exponential backoff (honouring Retry-After) before raising HTTPStatusError.
+class GlideClient:
+    def __init__(self, base_url, api_key, app_id, max_concurrency, timeout,
+                 max_retries=GLIDE_MAX_RETRIES, backoff=GLIDE_BACKOFF_SECONDS, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.app_id = app_id
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.transport = transport  # e.g. httpx.MockTransport in tests
+        self._client = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.retries = 0
+
+    def client(self):
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60,
+                ),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), 30.0)
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def post(self, path, body, call, idempotent):
+        retry_statuses = range(500, 600) if idempotent else GLIDE_RETRY_ALWAYS
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._slots:
+                    with glide_request_seconds.time(call):
+                        response = await self.client().post(path, json=body)
+                if response.status_code != 429 and response.status_code not in retry_statuses:
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # The request never reached Glide, so even mutations are safe to resend
+                if attempt >= self.max_retries:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+            if response is not None and attempt >= self.max_retries:
+                response.raise_for_status()
+            delay = self.retry_delay(attempt, response)
+            status = response.status_code if response is not None else "connection error"
+            logger.warning(f"Glide {call} got {status}, retrying in {delay:.2f}s")
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def query_tables(self, queries, call="query_tables"):
+        return await self.post("/queryTables", {"appID": self.app_id, "queries": queries}, call, idempotent=True)
+
+    async def mutate_tables(self, mutations, call="mutate_tables"):
+        return await self.post("/mutateTables", {"appID": self.app_id, "mutations": mutations}, call, idempotent=False)
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "retries": self.retries,
+        }
+
+glide = GlideClient(GLIDE_API_BASE, GLIDE_API_KEY, GLIDE_APP_ID, GLIDE_MAX_CONCURRENCY, GLIDE_TIMEOUT_SECONDS)
+
+# Drawings mirror: seconds before the local copy of GLIDE_TABLE is refreshed in the background
+GLIDE_MIRROR_TTL_SECONDS = float(os.environ.get("GLIDE_MIRROR_TTL_SECONDS", 300))
+
+# Drawing-number matching: how many indexed candidates are scored exactly per OCR text
+MATCH_CANDIDATES = int(os.environ.get("MATCH_CANDIDATES", 50))
+# Posting-list entries counted per lookup before very common trigrams are skipped
+MATCH_POSTINGS_BUDGET = int(os.environ.get("MATCH_POSTINGS_BUDGET", 5000))
+
+def match_key(text):
+    return unquote(text or "").strip().upper()
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Same rules as the spreadsheet's sequentialCharacterMatch (exact 1.0, prefix 0.99,
+# substring 0.85), plus trigram similarity for everything else. Fuzzy-only scores are
+# kept below 0.85 so they're offered as candidates but never pass the auto-match threshold.
+def match_score(query, target, query_grams):
+    if query == target:
+        return 1.0
+    if target.startswith(query):
+        return 0.99
+    if query in target:
+        return 0.85
+    target_grams = trigrams(target)
+    if not query_grams or not target_grams:
+        return 0.0
+    dice = 2 * len(query_grams & target_grams) / (len(query_grams) + len(target_grams))
+    return round(0.84 * dice, 4)
+
+# Trigram index over the mirror's drawing numbers. Only drawings sharing the OCR text's
+# rarer trigrams are considered, and only the MATCH_CANDIDATES sharing the most are
+# scored, so a lookup touches a few short posting lists instead of the whole catalog.
+class DrawingNumberIndex:
+    def __init__(self, rows):
+        self.rows = rows
+        self.keys = [match_key(row["drawingNumber"]) for row in rows]
+        self.grams = [trigrams(key) for key in self.keys]
+        self.postings = {}
+        self.by_project = {}
+        self.by_part = {}
+        for i, (row, key) in enumerate(zip(rows, self.keys)):
+            if not key:
+                continue
+            for gram in self.grams[i]:
+                self.postings.setdefault(gram, []).append(i)
+            self.by_project.setdefault(row["project"], set()).add(i)
+            self.by_part.setdefault((row["project"], row["partNumber"]), set()).add(i)
+
+    def scope(self, project=None, part_number=None):
+        if project and part_number:
+            return self.by_part.get((project, part_number), set())
+        if project:
+            return self.by_project.get(project, set())
+        return None  # the whole catalog
+
+    def candidates(self, query, grams, scope):
+        if not grams:
+            # Too short for a trigram: only scanned inside a project/part scope
+            return [i for i in scope if query in self.keys[i]] if scope is not None else []
+        lists = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        if scope is not None and len(scope) < sum(len(ids) for ids in lists):
+            # Small scope (the usual project/part case): cheaper to check its rows directly
+            shared = Counter({i: len(grams & self.grams[i]) for i in scope})
+        else:
+            # Rarest trigrams first; common ones ("DRG", "-00") are skipped once the
+            # budget is spent. Substring matches still carry every rare trigram.
+            shared = Counter()
+            budget = MATCH_POSTINGS_BUDGET
+            for ids in lists:
+                if shared and len(ids) > budget:
+                    break
+                shared.update(ids)
+                budget -= len(ids)
+            if scope is not None:
+                shared = Counter({i: n for i, n in shared.items() if i in scope})
+        return [i for i, n in shared.most_common(MATCH_CANDIDATES) if n]
+
+    def match(self, text, top_k=3, project=None, part_number=None):
+        query = match_key(text)
+        if not query:
+            return []
+        scope = self.scope(project, part_number)
+        grams = trigrams(query)
+        best = {}
+        for i in self.candidates(query, grams, scope):
+            key = self.keys[i]
+            score = match_score(query, key, grams)
+            if score > 0 and score > best.get(key, (0, None))[0]:
+                best[key] = (score, i)
+        # Highest score first, then alphabetical, as in findBestSequentialMatch
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1][0], kv[0]))[:top_k]
+        return [
+            {
+                "drawingNumber": unquote(self.rows[i]["drawingNumber"]),
+                "score": score,
+                "partName": self.rows[i]["partName"],
+                "drawingLink": self.rows[i]["drawingLink"],
+            }
+            for _, (score, i) in ranked
+        ]
+
+# Local copy of the drawings table indexed by (project, part number), so /fetch-drawings
+# answers from memory instead of downloading the whole table on every page load.
+# Lookups never wait on Glide once the first load is done; stale data is served
+# while a refresh runs, and a failed refresh keeps the previous copy.
+class DrawingsMirror:
+    def __init__(self, client, table, ttl):
+        self.client = client
+        self.table = table
+        self.ttl = ttl
+        self.index = {}  # (project, part) -> [trimmed row, ...]
+        self.rows = []  # every trimmed row, for lookups that aren't by project/part
+        self.drawing_numbers = DrawingNumberIndex([])
+        self.loaded_at = None
+        self.refreshes = 0
+        self.errors = 0
+        self.last_error = None
+        self._refresh_task = None
+        self._loop_task = None
+
+    @staticmethod
+    def trim(row):
+        return {
+            "project": row.get("VQlMl"),
+            "partNumber": row.get("nlHAO"),
+            "partName": row.get("Name"),
+            "drawingLink": row.get("9iB5E"),
+            "drawingNumber": extract_drawing_number(row.get("9iB5E"))
+        }
+
+    async def fetch_all(self):
+        # Glide returns large tables a page at a time; "next" is the cursor for the following page
+        rows = []
+        cursor = None
+        while True:
+            query = {"tableName": self.table, "utc": True}
+            if cursor:
+                query["startAt"] = cursor
+            page = (await self.client.query_tables([query], call="fetch_drawings"))[0]
+            rows.extend(page.get("rows", []))
+            cursor = page.get("next")
+            if not cursor:
+                return rows
+
+    async def _refresh(self):
+        started = time.perf_counter()
+        try:
+            raw_rows = await self.fetch_all()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.warning(f"Drawings mirror refresh failed: {e}")
+            raise
+        rows = [self.trim(row) for row in raw_rows]
+        index = {}
+        for row in rows:
+            index.setdefault((row["project"], row["partNumber"]), []).append(row)
+        drawing_numbers = DrawingNumberIndex(rows)
+        # Swap in one step so lookups never see a half-built index
+        self.rows, self.index, self.drawing_numbers = rows, index, drawing_numbers
+        self.loaded_at = time.time()
+        self.refreshes += 1
+        self.last_error = None
+        logger.info(f"Drawings mirror loaded {len(rows)} rows in {time.perf_counter() - started:.2f}s")
+
+    def refresh(self):
+        # Single-flight: concurrent callers share the refresh already in progress
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+        return asyncio.shield(self._refresh_task)
+
+    def is_stale(self):
+        return self.loaded_at is None or time.time() - self.loaded_at > self.ttl
+
+    async def ensure_loaded(self, force=False):
+        if self.loaded_at is None or force:
+            await self.refresh()
+        elif self.is_stale():
+            self.refresh().add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def lookup(self, project, part_number, force=False):
+        await self.ensure_loaded(force)
+        return self.index.get((project, part_number), [])
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass
+            await asyncio.sleep(max(self.ttl, 1))
+
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+
+    def stats(self):
+        return {
+            "rows": len(self.rows),
+            "keys": len(self.index),
+            "trigrams": len(self.drawing_numbers.postings),
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+drawings_mirror = DrawingsMirror(glide, GLIDE_TABLE, GLIDE_MIRROR_TTL_SECONDS)
+
+# Match a batch of OCR'd part numbers against the mirrored drawing numbers.
+# Body: {"texts": [...], "project": ..., "part": ..., "topK": 3}; project/part narrow the
+# catalog the same way /fetch-drawings does and may be left out to search everything.
+@app.post("/match-drawings")
+async def match_drawings(request: Request):
+    try:
+        try:
+            payload = await request.json()
+        except ValueError:
+            return JSONResponse(status_code=400, content={"error": "Body must be JSON"})
+        if not isinstance(payload, dict):
+            return JSONResponse(status_code=400, content={"error": "Body must be a JSON object"})
+        texts = payload.get("texts")
+        if not isinstance(texts, list) or not all(t is None or isinstance(t, str) for t in texts):
+            return JSONResponse(status_code=400, content={"error": "texts must be a list of strings"})
+        for field in ("project", "part"):
+            if payload.get(field) is not None and not isinstance(payload[field], str):
+                return JSONResponse(status_code=400, content={"error": f"{field} must be a string"})
+        top_k = payload.get("topK", 3)
+        if isinstance(top_k, str) and top_k.strip().lstrip("-").isdigit():
+            top_k = int(top_k)
+        if isinstance(top_k, bool) or not isinstance(top_k, int):
+            return JSONResponse(status_code=400, content={"error": "topK must be a whole number"})
+        top_k = max(1, min(top_k, 20))
+        await drawings_mirror.ensure_loaded(force=bool(payload.get("refresh")))
+        index = drawings_mirror.drawing_numbers
+        matches = [
+            {
+                "text": text,
+                "candidates": index.match(str(text or ""), top_k, payload.get("project"), payload.get("part"))
+            }
+            for text in texts
+        ]
+        return {"matches": matches}
+    except Exception as e:
+        logger.exception("❌ Exception in match_drawings")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+# Row inserts are sent to Glide in chunks of GLIDE_MUTATION_CHUNK, GLIDE_MUTATION_CONCURRENCY chunks at a time
+GLIDE_MUTATION_CHUNK = int(os.environ.get("GLIDE_MUTATION_CHUNK", 100))
+GLIDE_MUTATION_CONCURRENCY = int(os.environ.get("GLIDE_MUTATION_CONCURRENCY", 2))
+
+# Sends mutations in chunks and returns one result per mutation, in order:
+# {"ok": True, "result": <Glide result>} or {"ok": False, "status": <HTTP status or None>,
+# "error": ..., "retryable": <True when Glide certainly did not apply it>}.
+# A failed chunk only fails its own rows.
+async def mutate_in_chunks(mutations, call, chunk_size=None, concurrency=None):
+    chunk_size = max(1, chunk_size or GLIDE_MUTATION_CHUNK)
+    slots = asyncio.Semaphore(max(1, concurrency or GLIDE_MUTATION_CONCURRENCY))
+    chunks = [mutations[i:i + chunk_size] for i in range(0, len(mutations), chunk_size)]
+
+    async def send(chunk):
+        async with slots:
+            try:
+                result = await glide.mutate_tables(chunk, call=call)
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                failure = {"ok": False, "status": status, "error": e.response.text,
+                           "retryable": status in GLIDE_RETRY_ALWAYS}
+                return [failure] * len(chunk)
+            except Exception as e:
+                failure = {"ok": False, "status": None, "error": str(e),
+                           "retryable": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))}
+                return [failure] * len(chunk)
+        # Glide answers with one entry per mutation (e.g. the new rowID)
+        if not isinstance(result, list) or len(result) != len(chunk):
+            result = [result] + [None] * (len(chunk) - 1)
+        return [{"ok": True, "result": r} for r in result]
+
+    results = await asyncio.gather(*(send(chunk) for chunk in chunks))
+    return [r for chunk_results in results for r in chunk_results]
+
+# Shared tail of /add-child-parts and /add-bo-parts: insert the rows, report each row's
+# outcome, and only move the drawing's lastOcrBomItem on once every insert is confirmed
+async def push_rows(mutations, rows_data, call, label, row_id, max_item_number, write_behind=False,
+                    idempotency_key=None):
+    if write_behind:
+        queued = await asyncio.to_thread(
+            glide_write_queue.enqueue, mutations, call, row_id, max_item_number, idempotency_key
+        )
+        logger.info(f"📥 Queued {queued['queued']} {label} for Glide ({queued['duplicates']} duplicate)")
+        glide_write_queue.wake()
+        return {
+            "success": True,
+            "queued": True,
+            "message": f"Queued {queued['queued']} {label} for Glide",
+            **queued
+        }
+
+    logger.info(f"📤 Sending {len(mutations)} {label} to Glide in chunks of {GLIDE_MUTATION_CHUNK}...")
+    results = await mutate_in_chunks(mutations, call)
+    rows = [
+        {"index": i, "itemNumber": row.get("itemNumber"), **result}
+        for i, (row, result) in enumerate(zip(rows_data, results))
+    ]
+    failed = [row for row in rows if not row["ok"]]
+
+    if failed:
+        logger.warning(f"❌ {len(failed)} of {len(rows)} {label} failed: {failed[0]['error']}")
+        if len(failed) == len(rows) and failed[0]["status"]:
+            status_code = failed[0]["status"]
+        else:
+            status_code = 502
+        return JSONResponse(
+            status_code=status_code,
+            content={
+                "success": False,
+                "error": f"Glide API error: {len(failed)} of {len(rows)} {label} were not added: {failed[0]['error']}",
+                "added": len(rows) - len(failed),
+                "failed": len(failed),
+                "rows": rows
+            }
+        )
+
+    logger.info(f"✅ Added {len(rows)} {label} successfully")
+    if row_id and max_item_number:
+        update_success = await update_last_ocr_bom_item_direct(row_id, max_item_number)
+        logger.info(f"🎯 Drawing table update result: {update_success}")
+    return {
+        "success": True,
+        "message": f"Successfully added {len(rows)} {label}",
+        "glide_response": [row["result"] for row in rows],
+        "rows": rows
+    }
+
+# Write-behind for the submit endpoints: when GLIDE_WRITE_BEHIND=1 (or a request sends
+# "writeBehind": true) rows are stored in a local SQLite queue and acknowledged at once,
+# and a background flusher pushes them to Glide in batched mutations
+GLIDE_WRITE_BEHIND = os.environ.get("GLIDE_WRITE_BEHIND", "0") == "1"
+GLIDE_QUEUE_DB = os.environ.get("GLIDE_QUEUE_DB", "glide_queue.sqlite3")
+GLIDE_QUEUE_FLUSH_SECONDS = float(os.environ.get("GLIDE_QUEUE_FLUSH_SECONDS", 2))
+GLIDE_QUEUE_BATCH = int(os.environ.get("GLIDE_QUEUE_BATCH", 500))
+GLIDE_QUEUE_MAX_ATTEMPTS = int(os.environ.get("GLIDE_QUEUE_MAX_ATTEMPTS", 8))
+# Sent rows are kept this long so a repeated submit is still recognised as a duplicate
+GLIDE_QUEUE_RETENTION_HOURS = float(os.environ.get("GLIDE_QUEUE_RETENTION_HOURS", 24))
+
+# Durable queue of Glide row inserts and the lastOcrBomItem updates that follow them.
+# Every row carries an idempotency key ("<submit key>:<index>"; the submit key is the
+# client's idempotencyKey or a hash of the submit), so a repeated submit is ignored.
+# Rows are only resent when Glide certainly did not apply them (429/502/503/504, connection
+# failures); anything ambiguous is parked as "failed" for an operator to check and requeue.
+# A drawing's lastOcrBomItem update waits until all of its rows have been sent, and updates
+# queued for the same drawing are coalesced to the highest item number.
+class GlideWriteQueue:
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._wake = None
+        self._task = None
+        self.flushes = 0
+
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS glide_rows (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE NOT NULL,
+                    call TEXT NOT NULL,
+                    drawing_row_id TEXT,
+                    mutation TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS glide_rows_status ON glide_rows (status, next_attempt_at)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS glide_item_updates (
+                    drawing_row_id TEXT PRIMARY KEY,
+                    last_item INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL
+                )""")
+            # A crash mid-send leaves rows we can't know the fate of
+            self._db.execute(
+                "UPDATE glide_rows SET status = 'failed', last_error = ? WHERE status = 'sending'",
+                ("interrupted while sending; check Glide before requeueing",)
+            )
+        return self._db
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self.db().execute(sql, params).fetchall()
+
+    def enqueue(self, mutations, call, drawing_row_id, max_item_number, idempotency_key=None):
+        submit_key = idempotency_key or hashlib.sha256(
+            json.dumps([call, drawing_row_id, mutations], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        now = time.time()
+        with self._lock:
+            db = self.db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                queued = 0
+                for i, mutation in enumerate(mutations):
+                    cur = db.execute(
+                        "INSERT OR IGNORE INTO glide_rows "
+                        "(idempotency_key, call, drawing_row_id, mutation, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (f"{submit_key}:{i}", call, drawing_row_id, json.dumps(mutation), now, now)
+                    )
+                    queued += cur.rowcount
+                if drawing_row_id and max_item_number:
+                    db.execute(
+                        "INSERT INTO glide_item_updates (drawing_row_id, last_item, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (drawing_row_id) DO UPDATE SET "
+                        "last_item = MAX(last_item, excluded.last_item), status = 'pending', "
+                        "attempts = 0, updated_at = excluded.updated_at "
+                        "WHERE excluded.last_item > last_item OR status != 'sent'",
+                        (drawing_row_id, int(max_item_number), now)
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return {"idempotencyKey": submit_key, "queued": queued, "duplicates": len(mutations) - queued}
+
+    def wake(self):
+        # Event-loop thread only
+        self.start()
+        self._wake.set()
+
+    def claim_rows(self):
+        now = time.time()
+        with self._lock:
+            db = self.db()
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT id, call, mutation, attempts FROM glide_rows "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, GLIDE_QUEUE_BATCH)
+            ).fetchall()
+            db.executemany("UPDATE glide_rows SET status = 'sending', updated_at = ? WHERE id = ?",
+                           [(now, row["id"]) for row in rows])
+            db.execute("COMMIT")
+        return rows
+
+    def record_rows(self, rows, results):
+        now = time.time()
+        updates = []
+        for row, result in zip(rows, results):
+            attempts = row["attempts"] + 1
+            if result["ok"]:
+                updates.append(("sent", attempts, 0, None, json.dumps(result["result"]), now, row["id"]))
+            elif result["retryable"] and attempts < GLIDE_QUEUE_MAX_ATTEMPTS:
+                delay = min(300.0, GLIDE_BACKOFF_SECONDS * (2 ** attempts) * random.uniform(0.5, 1.5))
+                updates.append(("pending", attempts, now + delay, result["error"], None, now, row["id"]))
+            else:
+                updates.append(("failed", attempts, 0, result["error"], None, now, row["id"]))
+        with self._lock:
+            self.db().executemany(
+                "UPDATE glide_rows SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, "
+                "result = ?, updated_at = ? WHERE id = ?",
+                updates
+            )
+
+    def ready_item_updates(self):
+        # Drawings whose rows have all been sent; a failed row holds the update back
+        return self.execute(
+            "SELECT drawing_row_id, last_item, attempts FROM glide_item_updates u WHERE status = 'pending' "
+            "AND NOT EXISTS (SELECT 1 FROM glide_rows r WHERE r.drawing_row_id = u.drawing_row_id "
+            "AND r.status != 'sent')"
+        )
+
+    def record_item_update(self, update, ok):
+        attempts = update["attempts"] + 1
+        if ok:
+            status = "sent"
+        else:
+            status = "pending" if attempts < GLIDE_QUEUE_MAX_ATTEMPTS else "failed"
+        self.execute(
+            "UPDATE glide_item_updates SET status = ?, attempts = ?, last_error = ?, updated_at = ? "
+            "WHERE drawing_row_id = ? AND last_item = ?",
+            (status, attempts, None if ok else "update failed", time.time(),
+             update["drawing_row_id"], update["last_item"])
+        )
+
+    def prune(self):
+        cutoff = time.time() - GLIDE_QUEUE_RETENTION_HOURS * 3600
+        self.execute("DELETE FROM glide_rows WHERE status = 'sent' AND updated_at < ?", (cutoff,))
+        self.execute("DELETE FROM glide_item_updates WHERE status = 'sent' AND updated_at < ?", (cutoff,))
+
+    async def flush(self):
+        rows = await asyncio.to_thread(self.claim_rows)
+        by_call = {}
+        for row in rows:
+            by_call.setdefault(row["call"], []).append(row)
+        for call, call_rows in by_call.items():
+            results = await mutate_in_chunks([json.loads(row["mutation"]) for row in call_rows], call)
+            await asyncio.to_thread(self.record_rows, call_rows, results)
+            sent = sum(1 for r in results if r["ok"])
+            logger.info(f"📤 Write-behind flushed {sent}/{len(call_rows)} rows for {call}")
+        for update in await asyncio.to_thread(self.ready_item_updates):
+            ok = await update_last_ocr_bom_item_direct(update["drawing_row_id"], update["last_item"])
+            await asyncio.to_thread(self.record_item_update, update, ok)
+        self.flushes += 1
+        return len(rows)
+
+    async def _run(self):
+        await asyncio.to_thread(self.prune)
+        while True:
+            self._wake.clear()
+            try:
+                if await self.flush() >= GLIDE_QUEUE_BATCH:
+                    continue  # more waiting; go again straight away
+            except Exception:
+                logger.exception("Write-behind flush failed")
+            if self.flushes % 1000 == 0:
+                await asyncio.to_thread(self.prune)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=GLIDE_QUEUE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def requeue(self, ids=None):
+        # Failed rows back to pending (all of them, or just the given ids)
+        now = time.time()
+        if ids:
+            marks = ",".join("?" * len(ids))
+            self.execute(
+                f"UPDATE glide_rows SET status = 'pending', attempts = 0, next_attempt_at = 0, updated_at = ? "
+                f"WHERE status = 'failed' AND id IN ({marks})",
+                (now, *ids)
+            )
+        else:
+            self.execute(
+                "UPDATE glide_rows SET status = 'pending', attempts = 0, next_attempt_at = 0, updated_at = ? "
+                "WHERE status = 'failed'",
+                (now,)
+            )
+        self.execute(
+            "UPDATE glide_item_updates SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+            (now,)
+        )
+
+    def in_use(self):
+        # Off and never written to by this process: leave the SQLite file alone
+        return GLIDE_WRITE_BEHIND or self._db is not None
+
+    def stats(self):
+        counts = {status: 0 for status in ("pending", "sending", "sent", "failed")}
+        if not self.in_use():
+            return {**counts, "oldest_pending_seconds": 0, "item_updates_pending": 0,
+                    "item_updates_failed": 0, "flushes": self.flushes}
+        for row in self.execute("SELECT status, COUNT(*) AS n FROM glide_rows GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = self.execute("SELECT MIN(created_at) AS t FROM glide_rows WHERE status IN ('pending', 'sending')")
+        updates = {row["status"]: row["n"] for row in self.execute(
+            "SELECT status, COUNT(*) AS n FROM glide_item_updates GROUP BY status")}
+        return {
+            **counts,
+            "oldest_pending_seconds": round(time.time() - oldest[0]["t"], 1) if oldest[0]["t"] else 0,
+            "item_updates_pending": updates.get("pending", 0),
+            "item_updates_failed": updates.get("failed", 0),
+            "flushes": self.flushes,
+        }
+
+    def failed(self, limit=50):
+        if not self.in_use():
+            return {"rows": [], "item_updates": []}
+        rows = self.execute(
+            "SELECT id, idempotency_key, call, drawing_row_id, attempts, last_error, updated_at "
+            "FROM glide_rows WHERE status = 'failed' ORDER BY id LIMIT ?",
+            (limit,)
+        )
+        updates = self.execute(
+            "SELECT drawing_row_id, last_item, attempts, last_error FROM glide_item_updates WHERE status = 'failed'"
+        )
+        return {"rows": [dict(r) for r in rows], "item_updates": [dict(u) for u in updates]}
+
+glide_write_queue = GlideWriteQueue(GLIDE_QUEUE_DB)
+
+# Write-behind queue status: counts per state plus the failed rows
+@app.get("/glide-queue")
+async def glide_queue_status():
+    stats = await asyncio.to_thread(glide_write_queue.stats)
+    failed = await asyncio.to_thread(glide_write_queue.failed)
+    return {"enabled": GLIDE_WRITE_BEHIND, **stats, "failed_items": failed}
+
+# Put failed rows back in the queue once they've been checked: {"ids": [...]} or all of them
+@app.post("/glide-queue/retry")
+async def glide_queue_retry(request: Request):
+    payload = await request.json() if await request.body() else {}
+    if not glide_write_queue.in_use():
+        return await asyncio.to_thread(glide_write_queue.stats)
+    await asyncio.to_thread(glide_write_queue.requeue, payload.get("ids"))
+    glide_write_queue.wake()
+    return await asyncio.to_thread(glide_write_queue.stats)
+
 @app.post("/fetch-drawings")
 async def fetch_drawings(request: Request):
     print("🎯 /fetch-drawings endpoint hit")
@@ -654,61 +3536,10 @@ async def fetch_drawings(request: Request):
         if not project or not part_number:
             return {"error": "Missing project or part"}
 
-        # ✅ Correct API format
-        body = {
-            "appID": GLIDE_APP_ID,
-            "queries": [
-                {
-                    "tableName": GLIDE_TABLE,
-                    "utc": True
-                }
-            ]
-        }
-        
-        print("📤 Sending request to Glide:", body)
-
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                "https://api.glideapp.io/api/function/queryTables",
-                headers={
-                    "Authorization": f"Bearer {GLIDE_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json=body
-            )
-
-        res.raise_for_status()
-        
-        try:
-            full_data = res.json()
-            print("✅ Full response from Glide:", full_data)
-            # ✅ Extract and filter rows manually
-            all_rows = full_data[0]["rows"]
-            filtered = [
-                row for row in all_rows
-                if row.get("VQlMl") == project and row.get("nlHAO") == part_number
-            ]
-
-            print(f"✅ Filtered rows: {len(filtered)} match")
-            # ✅ Add extracted drawingNumber from drawing link
-            filtered_trimmed = [
-                {
-                    "project": row.get("VQlMl"),
-                    "partNumber": row.get("nlHAO"),
-                    "partName": row.get("Name"),
-                    "drawingLink": row.get("9iB5E"),
-                    "drawingNumber": extract_drawing_number(row.get("9iB5E"))
-                }
-                for row in filtered
-            ]
-        
-            return {"rows": filtered_trimmed}
-        
-        except Exception:
-            error_text = await res.aread()
-            print("❌ Non-JSON response from Glide:", error_text.decode())
-            raise
-
+        # ✅ Served from the local mirror; "refresh": true re-reads the table from Glide first
+        filtered_trimmed = await drawings_mirror.lookup(project, part_number, force=bool(payload.get("refresh")))
+        print(f"✅ Filtered rows: {len(filtered_trimmed)} match")
+        return {"rows": filtered_trimmed}
 
     except Exception as e:
         import traceback
@@ -774,46 +3605,13 @@ async def add_child_parts(request: Request):
                 content={"error": "No valid rows to add (missing required fields)"}
             )
         
-        # Prepare Glide API request
-        glide_body = {
-            "appID": GLIDE_APP_ID,
-            "mutations": mutations
-        }
-        
-        print(f"📤 Sending {len(mutations)} child parts to Glide...")
-        
         # Send to Glide API
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.glideapp.io/api/function/mutateTables",
-                headers={
-                    "Authorization": f"Bearer {GLIDE_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json=glide_body
-            )
-        
-        response.raise_for_status()
-        result = response.json()
-        
-        print("✅ Child Parts added successfully:", result)
-
-        if rowID and maxItemNumber:
-            update_success = await update_last_ocr_bom_item_direct(rowID, maxItemNumber)
-            print(f"🎯 Drawing table update result: {update_success}") 
-        return {
-            "success": True, 
-            "message": f"Successfully added {len(mutations)} child parts",
-            "glide_response": result
-        }
-        
-    except httpx.HTTPStatusError as e:
-        error_text = await e.response.aread()
-        print(f"❌ Glide API Error: {e.response.status_code} - {error_text.decode()}")
-        return JSONResponse(
-            status_code=e.response.status_code,
-            content={"error": f"Glide API error: {error_text.decode()}"}
+        return await push_rows(
+            mutations, rows_data, "add_child_parts", "child parts", rowID, maxItemNumber,
+            write_behind=payload.get("writeBehind", GLIDE_WRITE_BEHIND),
+            idempotency_key=payload.get("idempotencyKey")
         )
+        
     except Exception as e:
         import traceback
         print("❌ Exception in add_child_parts:")
@@ -881,47 +3679,13 @@ async def add_bo_parts(request: Request):
                 content={"error": "No valid rows to add (missing required fields)"}
             )
         
-        # Prepare Glide API request
-        glide_body = {
-            "appID": GLIDE_APP_ID,
-            "mutations": mutations
-        }
-        
-        print(f"📤 Sending {len(mutations)} BO parts to Glide...")
-        
         # Send to Glide API
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.glideapp.io/api/function/mutateTables",
-                headers={
-                    "Authorization": f"Bearer {GLIDE_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json=glide_body
-            )
-        
-        response.raise_for_status()
-        result = response.json()
-        
-        print("✅ BO Parts added successfully:", result)
-
-        if rowID and maxItemNumber:
-            update_success = await update_last_ocr_bom_item_direct(rowID, maxItemNumber)
-            print(f"🎯 Drawing table update result: {update_success}") 
-
-        return {
-            "success": True,
-            "message": f"Successfully added {len(mutations)} BO parts", 
-            "glide_response": result
-        }
-        
-    except httpx.HTTPStatusError as e:
-        error_text = await e.response.aread()
-        print(f"❌ Glide API Error: {e.response.status_code} - {error_text.decode()}")
-        return JSONResponse(
-            status_code=e.response.status_code,
-            content={"error": f"Glide API error: {error_text.decode()}"}
+        return await push_rows(
+            mutations, rows_data, "add_bo_parts", "BO parts", rowID, maxItemNumber,
+            write_behind=payload.get("writeBehind", GLIDE_WRITE_BEHIND),
+            idempotency_key=payload.get("idempotencyKey")
         )
+        
     except Exception as e:
         import traceback
         print("❌ Exception in add_bo_parts:")
@@ -933,6 +3697,21 @@ async def add_bo_parts(request: Request):
 # Childpart & BO Data Post Ends here
 
 
+# Debug artifacts: list them (optionally for one request id) and fetch one as PNG
+@app.get("/debug/artifacts")
+async def list_debug_artifacts(request_id: str = None):
+    if not debug_sink.enabled:
+        return JSONResponse(status_code=404, content={"error": "Debug artifacts are disabled"})
+    return {"artifacts": debug_sink.list(request_id), "dropped": debug_sink.dropped}
+
+@app.get("/debug/artifacts/{artifact_id}")
+async def get_debug_artifact(artifact_id: str):
+    artifact = debug_sink.get(artifact_id) if debug_sink.enabled else None
+    if artifact is None:
+        return JSONResponse(status_code=404, content={"error": "Artifact not found"})
+    return Response(content=artifact["data"], media_type="image/png")
+
+
 @app.get("/debug")
 async def debug():
     print("✅ /debug route hit", flush=True)
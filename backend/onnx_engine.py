@@ -0,0 +1,236 @@
+# PP-OCRv3 det / cls / rec on ONNX Runtime (CPU), with the same entry points the OCR
+# pipeline in main.py uses on PaddleOCR: text_detector, text_classifier, text_recognizer.
+# Pre- and post-processing follow PaddleOCR 2.x defaults, so results should agree with the
+# Paddle engine; bench_engines.py measures how closely.
+#
+# Needs onnxruntime (pip install onnxruntime) and the Paddle models converted once with
+# paddle2onnx, e.g. for the detector:
+#   paddle2onnx --model_dir ~/.paddleocr/whl/det/en/en_PP-OCRv3_det_infer \
+#       --model_filename inference.pdmodel --params_filename inference.pdiparams \
+#       --save_file ~/.paddleocr/onnx/det.onnx --opset_version 11
+# and the same for rec.onnx and cls.onnx, plus PaddleOCR's ppocr/utils/en_dict.txt
+# copied next to them. The engine checks for these files up front and names whatever is
+# missing, instead of failing inside onnxruntime.
+#
+# Local/benchmark use only: the Docker image ships neither onnxruntime nor converted
+# models, and leaves this file out (see the Dockerfile).
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+import pyclipper
+
+# DB detector (PaddleOCR's det_db_* defaults)
+DET_LIMIT_SIDE = 960
+DET_THRESH = 0.3
+DET_BOX_THRESH = 0.6
+DET_UNCLIP_RATIO = 1.5
+DET_MAX_CANDIDATES = 1000
+DET_MIN_SIZE = 3
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+CLS_SHAPE = (3, 48, 192)
+CLS_LABELS = ("0", "180")
+REC_SHAPE = (3, 48, 320)
+
+
+def import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError("OCR_ENGINE=onnx needs onnxruntime: pip install onnxruntime") from None
+    return onnxruntime
+
+
+def make_session(path, threads):
+    ort = import_onnxruntime()
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def load_charset(path):
+    # index 0 is the CTC blank; PP-OCRv3 en appends a space as the last class
+    with open(path, encoding="utf-8") as fh:
+        chars = [line.rstrip("\r\n") for line in fh]
+    return ["blank"] + chars + [" "]
+
+
+def resize_norm(img, shape, max_wh_ratio=None):
+    """Resize a text crop to the model height, keep its aspect ratio, normalize to [-1, 1]
+    and right-pad with zeros to the target width (PaddleOCR's resize_norm_img)."""
+    c, h, w = shape
+    if max_wh_ratio is not None:
+        w = int(h * max_wh_ratio)
+    ratio = img.shape[1] / float(img.shape[0])
+    resized_w = w if math.ceil(h * ratio) > w else int(math.ceil(h * ratio))
+    resized = cv2.resize(img, (resized_w, h)).astype(np.float32)
+    resized = resized.transpose((2, 0, 1)) / 255
+    resized = (resized - 0.5) / 0.5
+    padded = np.zeros((c, h, w), dtype=np.float32)
+    padded[:, :, :resized_w] = resized
+    return padded
+
+
+def mini_box(contour):
+    """Corners of the contour's minimum-area rectangle, ordered clockwise from top-left,
+    and the rectangle's shorter side."""
+    rect = cv2.minAreaRect(contour)
+    points = sorted(list(cv2.boxPoints(rect)), key=lambda p: p[0])
+    i1, i4 = (0, 1) if points[1][1] > points[0][1] else (1, 0)
+    i2, i3 = (2, 3) if points[3][1] > points[2][1] else (3, 2)
+    return np.array([points[i1], points[i2], points[i3], points[i4]]), min(rect[1])
+
+
+def box_score(prob, box):
+    """Mean probability inside the box (DB's "fast" score)."""
+    h, w = prob.shape
+    xmin = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1))
+    xmax = int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+    ymin = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1))
+    ymax = int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+    mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+    shifted = box - [xmin, ymin]
+    cv2.fillPoly(mask, shifted.reshape(1, -1, 2).astype(np.int32), 1)
+    return cv2.mean(prob[ymin:ymax + 1, xmin:xmax + 1], mask)[0]
+
+
+def unclip(box, ratio):
+    """Grow the shrunk text kernel back out by area * ratio / perimeter."""
+    x, y = box[:, 0], box[:, 1]
+    area = 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+    length = np.sum(np.linalg.norm(box - np.roll(box, 1, axis=0), axis=1))
+    if length == 0:
+        return None
+    offset = pyclipper.PyclipperOffset()
+    offset.AddPath([tuple(p) for p in box.astype(np.int64)], pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+    expanded = offset.Execute(area * ratio / length)
+    if len(expanded) != 1:
+        return None
+    return np.array(expanded[0])
+
+
+def order_clockwise(pts):
+    rect = np.zeros((4, 2), dtype=np.float32)
+    s = pts.sum(axis=1)
+    rect[0], rect[2] = pts[np.argmin(s)], pts[np.argmax(s)]
+    rest = np.delete(pts, (np.argmin(s), np.argmax(s)), axis=0)
+    diff = np.diff(rest, axis=1)
+    rect[1], rect[3] = rest[np.argmin(diff)], rest[np.argmax(diff)]
+    return rect
+
+
+def db_boxes(prob, src_w, src_h):
+    """Text boxes (4 points each, in source-image pixels) from a DB probability map."""
+    height, width = prob.shape
+    bitmap = (prob > DET_THRESH).astype(np.uint8) * 255
+    contours, _ = cv2.findContours(bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours[:DET_MAX_CANDIDATES]:
+        points, side = mini_box(contour)
+        if side < DET_MIN_SIZE:
+            continue
+        if box_score(prob, points) < DET_BOX_THRESH:
+            continue
+        expanded = unclip(points, DET_UNCLIP_RATIO)
+        if expanded is None:
+            continue
+        box, side = mini_box(expanded.reshape(-1, 1, 2).astype(np.float32))
+        if side < DET_MIN_SIZE + 2:
+            continue
+        box[:, 0] = np.clip(np.round(box[:, 0] / width * src_w), 0, src_w)
+        box[:, 1] = np.clip(np.round(box[:, 1] / height * src_h), 0, src_h)
+        box = order_clockwise(box.astype(np.float32))
+        box[:, 0] = np.clip(box[:, 0], 0, src_w - 1)
+        box[:, 1] = np.clip(box[:, 1], 0, src_h - 1)
+        if int(np.linalg.norm(box[0] - box[1])) <= 3 or int(np.linalg.norm(box[0] - box[3])) <= 3:
+            continue
+        boxes.append(box)
+    return boxes
+
+
+def ctc_decode(probs, charset):
+    """Greedy CTC: best class per step, collapse repeats, drop blanks.
+    Returns (text, mean probability of the kept characters)."""
+    idx = probs.argmax(axis=1)
+    conf = probs.max(axis=1)
+    keep = idx != 0
+    keep[1:] &= idx[1:] != idx[:-1]
+    text = "".join(charset[i] for i in idx[keep] if i < len(charset))
+    return text, float(conf[keep].mean()) if keep.any() else 0.0
+
+
+class ONNXOCREngine:
+    use_angle_cls = True
+    drop_score = 0.5
+    cls_thresh = 0.9
+
+    def __init__(self, model_dir, threads=4, rec_batch=6, cls_batch=6, charset_path=None):
+        charset_path = charset_path or os.path.join(model_dir, "en_dict.txt")
+        required = [os.path.join(model_dir, "det.onnx"), os.path.join(model_dir, "rec.onnx"), charset_path]
+        missing = [path for path in required if not os.path.isfile(path)]
+        if missing:
+            raise FileNotFoundError(
+                f"ONNX OCR models not found: {', '.join(missing)}. Convert the PaddleOCR models with "
+                f"paddle2onnx into {model_dir} (see onnx_engine.py) or point OCR_ONNX_DIR at them"
+            )
+        self.det = make_session(os.path.join(model_dir, "det.onnx"), threads)
+        self.rec = make_session(os.path.join(model_dir, "rec.onnx"), threads)
+        cls_path = os.path.join(model_dir, "cls.onnx")
+        self.cls = make_session(cls_path, threads) if os.path.exists(cls_path) else None
+        if self.cls is None:
+            self.use_angle_cls = False
+        self.charset = load_charset(charset_path)
+        self.rec_batch = max(1, rec_batch)
+        self.cls_batch = max(1, cls_batch)
+
+    def text_detector(self, img):
+        started = time.perf_counter()
+        h, w = img.shape[:2]
+        ratio = min(1.0, DET_LIMIT_SIDE / max(h, w))
+        resize_h = max(int(round(h * ratio / 32) * 32), 32)
+        resize_w = max(int(round(w * ratio / 32) * 32), 32)
+        resized = cv2.resize(img, (resize_w, resize_h)).astype(np.float32) / 255
+        tensor = ((resized - DET_MEAN) / DET_STD).transpose((2, 0, 1))[np.newaxis]
+        prob = self.det.run(None, {self.det.get_inputs()[0].name: tensor})[0][0, 0]
+        return np.array(db_boxes(prob, w, h), dtype=np.float32), time.perf_counter() - started
+
+    def _batches(self, crops, size):
+        # similar aspect ratios share a batch, so little of each batch is padding
+        order = np.argsort([crop.shape[1] / float(crop.shape[0]) for crop in crops])
+        for start in range(0, len(order), size):
+            yield order[start:start + size]
+
+    def text_classifier(self, crops):
+        started = time.perf_counter()
+        crops = list(crops)
+        results = [("0", 0.0)] * len(crops)
+        name = self.cls.get_inputs()[0].name
+        for batch in self._batches(crops, self.cls_batch):
+            tensor = np.stack([resize_norm(crops[i], CLS_SHAPE) for i in batch])
+            probs = self.cls.run(None, {name: tensor})[0]
+            for i, p in zip(batch, probs):
+                label, score = CLS_LABELS[int(p.argmax())], float(p.max())
+                results[i] = (label, score)
+                if label == "180" and score > self.cls_thresh:
+                    crops[i] = cv2.rotate(crops[i], cv2.ROTATE_180)
+        return crops, results, time.perf_counter() - started
+
+    def text_recognizer(self, crops):
+        started = time.perf_counter()
+        results = [("", 0.0)] * len(crops)
+        name = self.rec.get_inputs()[0].name
+        c, h, w = REC_SHAPE
+        for batch in self._batches(crops, self.rec_batch):
+            max_ratio = max([w / h] + [crops[i].shape[1] / float(crops[i].shape[0]) for i in batch])
+            tensor = np.stack([resize_norm(crops[i], REC_SHAPE, max_ratio) for i in batch])
+            probs = self.rec.run(None, {name: tensor})[0]
+            for i, p in zip(batch, probs):
+                results[i] = ctc_decode(p, self.charset)
+        return results, time.perf_counter() - started